@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark hors ligne de l'import complet (main()) contre une banque et un Firefly III synthétiques.
+
+    python benchmarks/bench_import.py --scenario all
+    python benchmarks/bench_import.py --scenario daily --latency-ms 20 --error-rate 0.02
+    python benchmarks/bench_import.py --json results.json --baseline previous.json
+
+Chaque scénario exécute main() dans un processus séparé (mémoire crête mesurée pour l'importeur
+seul) et rapporte la durée, le nombre de requêtes Firefly et la mémoire crête (RSS).
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bank import BankParameters, install, iter_operations  # noqa: E402
+from fake_firefly import FakeFirefly  # noqa: E402
+
+SCENARIOS = ('backfill', 'daily', 'large-history')
+# Mesures comparées à la référence (--baseline) pour détecter une régression
+REGRESSION_METRICS = ('wall_seconds', 'requests', 'peak_rss_mb')
+
+
+def write_config(directory, firefly_url, reconcile=False):
+    path = os.path.join(directory, 'config.ini')
+    with open(path, 'w', encoding='utf-8') as config_file:
+        config_file.write(f"""[GlobalSettings]
+data_dir = {os.path.join(directory, 'data')}
+reconcile = {str(reconcile).lower()}
+account_concurrency = 3
+
+[FireflyIII]
+url = {firefly_url}
+personal_access_token = benchmark
+import_concurrency = 4
+max_retries = 5
+backoff_factor = 0.05
+backoff_max = 1
+
+[CreditAgricole]
+username = benchmark
+password = 123456
+department = 31
+get_transactions_period_days = 30
+backfill_window_days = 90
+""")
+    return path
+
+
+def preload_history(firefly, parameters):
+    """Historique déjà importé dans Firefly (comptes et transactions), sans passer par HTTP"""
+    from normalize import dedup_key, operation_fingerprint
+    for account_index in range(parameters.accounts):
+        account_number = parameters.account_number(account_index)
+        account = firefly.state.create_account({'name': f"Compte synthétique {account_index}", 'type': 'asset', 'account_number': account_number})
+        occurrences = {}
+        for operation in iter_operations(parameters, account_index, parameters.first_day().isoformat(), parameters.today):
+            key = dedup_key(operation.dateOp, operation.montantOp, operation.libelleOp)
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+            firefly.state.create_transaction({"error_if_duplicate_hash": True, "transactions": [{
+                "type": "withdrawal" if operation.montantOp < 0 else "deposit",
+                "date": key[0],
+                "amount": key[1],
+                "description": key[2],
+                "source_id": account['id'] if operation.montantOp < 0 else None,
+                "destination_id": account['id'] if operation.montantOp >= 0 else None,
+                "external_id": operation_fingerprint(account_number, key, occurrence),
+            }]})
+
+
+def run_worker(config_path, argv, parameters, verbose):
+    """Exécute main() dans un sous-processus ; retourne ses mesures"""
+    spec = json.dumps({'config': config_path, 'argv': argv, 'bank': parameters.as_dict(), 'verbose': verbose})
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', spec], stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout.decode('utf-8').strip().splitlines()[-1])
+
+
+def worker(spec):
+    spec = json.loads(spec)
+    install(BankParameters.from_dict(spec['bank']))
+    import logging
+    import main as importer_main
+    importer_main.CONFIG_FILE = spec['config']
+    if not spec['verbose']:
+        logging.getLogger().setLevel(logging.ERROR)
+    start = time.perf_counter()
+    importer_main.main(spec['argv'])
+    wall_seconds = time.perf_counter() - start
+    report = {}
+    data_dir = os.path.join(os.path.dirname(spec['config']), 'data')
+    try:
+        with open(os.path.join(data_dir, 'run_report.json'), encoding='utf-8') as report_file:
+            report = json.load(report_file)
+    except (OSError, ValueError):
+        pass
+    print(json.dumps({
+        'wall_seconds': round(wall_seconds, 3),
+        # ru_maxrss est exprimé en kilo-octets sous Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'imported': report.get('counters', {}).get('transactions_imported', 0),
+        'retries': report.get('http', {}).get('retries', 0),
+    }))
+
+
+def run_scenario(name, args):
+    parameters = BankParameters(accounts=args.accounts, ops_per_day=args.ops_per_day, history_days=args.history_days,
+                                fetch_latency_ms=args.bank_latency_ms)
+    firefly = FakeFirefly(latency_ms=args.latency_ms, error_rate=args.error_rate).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as directory:
+            argv = []
+            if name == 'backfill':
+                # Premier import de tout l'historique, Firefly vide
+                argv = ['--backfill', '--since', parameters.first_day().isoformat()]
+                config_path = write_config(directory, firefly.url)
+            elif name == 'daily':
+                # Exécution quotidienne après un backfill (non mesuré) : quelques opérations nouvelles
+                config_path = write_config(directory, firefly.url)
+                run_worker(config_path, ['--backfill', '--since', parameters.first_day().isoformat()], parameters, args.verbose)
+                parameters.new_operations = args.new_operations
+            else:
+                # Gros historique déjà dans Firefly, index local reconstruit (reconcile)
+                parameters.history_days = args.large_history_days
+                preload_history(firefly, parameters)
+                parameters.new_operations = args.new_operations
+                config_path = write_config(directory, firefly.url, reconcile=True)
+            requests_before = firefly.state.requests
+            errors_before = firefly.state.injected_errors
+            result = run_worker(config_path, argv, parameters, args.verbose)
+            result['requests'] = firefly.state.requests - requests_before
+            result['injected_errors'] = firefly.state.injected_errors - errors_before
+            return result
+    finally:
+        firefly.stop()
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        for metric in REGRESSION_METRICS:
+            reference = baseline.get(name, {}).get(metric)
+            if reference and result[metric] > reference * (1 + tolerance):
+                regressions.append(f"{name} : {metric} {result[metric]} > {reference} (+{tolerance:.0%})")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    arg_parser.add_argument('--accounts', type=int, default=3)
+    arg_parser.add_argument('--ops-per-day', type=int, default=4)
+    arg_parser.add_argument('--history-days', type=int, default=365, help="Historique des scénarios backfill et daily")
+    arg_parser.add_argument('--large-history-days', type=int, default=1825, help="Historique du scénario large-history")
+    arg_parser.add_argument('--new-operations', type=int, default=20, help="Opérations nouvelles par compte (daily, large-history)")
+    arg_parser.add_argument('--latency-ms', type=float, default=2.0, help="Latence de chaque requête Firefly")
+    arg_parser.add_argument('--bank-latency-ms', type=float, default=50.0, help="Latence de chaque requête bancaire")
+    arg_parser.add_argument('--error-rate', type=float, default=0.01, help="Part des requêtes Firefly en 429/503")
+    arg_parser.add_argument('--json', help="Enregistre les résultats dans ce fichier")
+    arg_parser.add_argument('--baseline', help="Résultats de référence (--json) : code de sortie 1 en cas de régression")
+    arg_parser.add_argument('--tolerance', type=float, default=0.2)
+    arg_parser.add_argument('--verbose', action='store_true', help="Conserve les logs de l'importeur")
+    arg_parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.worker:
+        worker(args.worker)
+        return
+
+    results = {}
+    for name in (SCENARIOS if args.scenario == 'all' else (args.scenario,)):
+        result = results[name] = run_scenario(name, args)
+        print(f"{name:<14} {result['wall_seconds']:>8.2f} s  {result['requests']:>7} requêtes "
+              f"({result['retries']} relances, {result['injected_errors']} erreurs injectées)  "
+              f"{result['peak_rss_mb']:>7.1f} Mo RSS  {result['imported']} transactions importées")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as results_file:
+            json.dump(results, results_file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark des clés de dédoublonnage : dateutil + float contre normalize.dedup_key.
+
+    python benchmarks/bench_normalize.py --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalize import dedup_key  # noqa: E402
+
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def generate_rows(count, seed=42):
+    """Lignes synthétiques : (date Firefly ISO, montant Firefly, dateOp CA, montantOp CA, libellé)"""
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    rows = []
+    for _ in range(count):
+        day = start + timedelta(days=rng.randrange(4000))
+        cents = rng.randrange(1, 500000)
+        rows.append((
+            f"{day.isoformat()}T00:00:00+01:00",
+            f"{cents // 100}.{cents % 100:02d}0000000000",
+            f"{MONTH_NAMES[day.month - 1]} {day.day}, {day.year} 12:00:00 AM",
+            -cents / 100,
+            f"  CB MAGASIN {rng.randrange(1000)}  ",
+        ))
+    return rows
+
+
+def legacy_keys(rows):
+    from dateutil import parser
+    keys = []
+    for firefly_date, firefly_amount, ca_date, ca_amount, label in rows:
+        keys.append((parser.parse(firefly_date).strftime("%Y-%m-%d"), f"{float(firefly_amount):.2f}", label.strip()))
+        keys.append((parser.parse(ca_date).strftime("%Y-%m-%d"), f"{abs(float(ca_amount)):.2f}", label.strip()))
+    return keys
+
+
+def normalized_keys(rows):
+    keys = []
+    for firefly_date, firefly_amount, ca_date, ca_amount, label in rows:
+        keys.append(dedup_key(firefly_date, firefly_amount, label))
+        keys.append(dedup_key(ca_date, ca_amount, label))
+    return keys
+
+
+def timed(function, rows):
+    start = time.perf_counter()
+    result = function(rows)
+    return time.perf_counter() - start, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    rows = generate_rows(args.rows)
+    new_time, new_keys = timed(normalized_keys, rows)
+    print(f"normalize.dedup_key : {new_time:.3f} s pour {2 * args.rows} clés ({2 * args.rows / new_time:,.0f} clés/s)")
+
+    try:
+        legacy_time, old_keys = timed(legacy_keys, rows)
+    except ImportError:
+        print("dateutil non installé : comparaison avec l'ancienne méthode impossible")
+        return
+    print(f"dateutil + float     : {legacy_time:.3f} s pour {2 * args.rows} clés ({2 * args.rows / legacy_time:,.0f} clés/s)")
+    print(f"Accélération         : x{legacy_time / new_time:.1f}")
+    if old_keys != new_keys:
+        print("ATTENTION : les clés produites diffèrent de l'ancienne méthode")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
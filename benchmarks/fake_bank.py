@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Substitut hors ligne de creditagricole_particuliers pour les benchmarks.
+
+install() enregistre dans sys.modules un module exposant Authenticator, Accounts et Operations,
+qui génèrent des opérations synthétiques déterministes : deux exécutions avec les mêmes
+paramètres lisent exactement les mêmes opérations, comme une vraie banque.
+"""
+import random
+import sys
+import time
+import types
+from datetime import date, timedelta
+
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+LABELS = ('CB CARREFOUR', 'CB BOULANGERIE', 'PRLV EDF', 'CB SNCF', 'PRLV FREE MOBILE', 'CB PHARMACIE', 'RETRAIT DAB')
+TRANSFER_EVERY_DAYS = 10
+
+
+class BankParameters:
+    def __init__(self, accounts=3, ops_per_day=4, history_days=365, new_operations=0, fetch_latency_ms=0.0,
+                 login_latency_ms=0.0, seed=42, today=None):
+        self.accounts = accounts
+        self.ops_per_day = ops_per_day
+        self.history_days = history_days
+        # Opérations supplémentaires datées du jour (exécution quotidienne avec du nouveau)
+        self.new_operations = new_operations
+        self.fetch_latency = fetch_latency_ms / 1000
+        self.login_latency = login_latency_ms / 1000
+        self.seed = seed
+        self.today = today or date.today().isoformat()
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+    def as_dict(self):
+        return {
+            'accounts': self.accounts, 'ops_per_day': self.ops_per_day, 'history_days': self.history_days,
+            'new_operations': self.new_operations, 'fetch_latency_ms': self.fetch_latency * 1000,
+            'login_latency_ms': self.login_latency * 1000, 'seed': self.seed, 'today': self.today,
+        }
+
+    def account_number(self, index):
+        return f"{90000000000 + index:011d}"
+
+    def first_day(self):
+        return date.fromisoformat(self.today) - timedelta(days=self.history_days)
+
+
+class FakeOperation:
+    def __init__(self, day, amount, label):
+        self.dateOp = f"{MONTH_NAMES[day.month - 1]} {day.day}, {day.year} 12:00:00 AM"
+        self.montantOp = amount
+        self.libelleOp = label
+
+
+def operations_for_day(parameters, account_index, day):
+    """Opérations d'un compte pour une journée (montants signés en euros)"""
+    rng = random.Random(f"{parameters.seed}-{account_index}-{day.isoformat()}")
+    operations = []
+    for _ in range(parameters.ops_per_day):
+        label = rng.choice(LABELS)
+        operations.append(FakeOperation(day, -rng.randrange(100, 20000) / 100, f"{label} {rng.randrange(100)}"))
+    # Virement périodique du premier compte vers le deuxième
+    if parameters.accounts > 1 and day.toordinal() % TRANSFER_EVERY_DAYS == 0 and account_index in (0, 1):
+        amount = random.Random(f"{parameters.seed}-transfer-{day.isoformat()}").randrange(1000, 100000) / 100
+        if account_index == 0:
+            operations.append(FakeOperation(day, -amount, "VIREMENT EMIS LIVRET"))
+        else:
+            operations.append(FakeOperation(day, amount, "VIREMENT EN VOTRE FAVEUR"))
+    if day.isoformat() == parameters.today:
+        for rank in range(parameters.new_operations):
+            operations.append(FakeOperation(day, -(rank + 1) * 1.11, f"CB NOUVEL ACHAT {account_index}-{rank}"))
+    return operations
+
+
+def iter_operations(parameters, account_index, date_start, date_stop):
+    first_day = parameters.first_day()
+    today = date.fromisoformat(parameters.today)
+    day = max(date.fromisoformat(date_start), first_day)
+    stop = min(date.fromisoformat(date_stop), today)
+    while day <= stop:
+        yield from operations_for_day(parameters, account_index, day)
+        day += timedelta(days=1)
+
+
+def install(parameters):
+    """Remplace creditagricole_particuliers par le substitut synthétique"""
+
+    class Authenticator:
+        def __init__(self, username, password, department):
+            time.sleep(parameters.login_latency)
+            self.url = 'https://fake.credit-agricole.local'
+            self.ssl_verify = True
+            self.username = username
+            self.password = password
+            self.department = department
+            self.regional_bank_url = f"{self.url}/{department}"
+            self.cookies = {}
+
+    class FakeAccount:
+        def __init__(self, index):
+            self.numeroCompte = parameters.account_number(index)
+            self.compteIdx = index
+            self.grandeFamilleCode = '1'
+            self.account = {'libelleProduit': f"Compte synthétique {index}", 'solde': 1000.0, 'libelleDevise': 'EUR'}
+
+    class Accounts:
+        def __init__(self, session):
+            time.sleep(parameters.fetch_latency)
+            self.accounts = [FakeAccount(index) for index in range(parameters.accounts)]
+
+        def __iter__(self):
+            return iter(self.accounts)
+
+    class Operations:
+        def __init__(self, session, compteIdx, grandeFamilleCode, date_start, date_stop):
+            # Comme la bibliothèque réelle, la requête est entièrement matérialisée
+            time.sleep(parameters.fetch_latency)
+            self.list = list(iter_operations(parameters, compteIdx, date_start, date_stop))
+
+        def __iter__(self):
+            return iter(self.list)
+
+    package = types.ModuleType('creditagricole_particuliers')
+    package.__path__ = []
+    package.Authenticator = Authenticator
+    package.Accounts = Accounts
+    operations_module = types.ModuleType('creditagricole_particuliers.operations')
+    operations_module.Operations = Operations
+    package.Operations = Operations
+    package.operations = operations_module
+    sys.modules['creditagricole_particuliers'] = package
+    sys.modules['creditagricole_particuliers.operations'] = operations_module
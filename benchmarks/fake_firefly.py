@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""API Firefly III minimale et locale pour les benchmarks.
+
+Couvre les appels de l'importeur : comptes (liste paginée, création), transactions d'un compte
+(paginées, filtrées par dates) et création de transactions avec error_if_duplicate_hash.
+Latence et erreurs 429/503 injectées sont configurables.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PAGE_SIZE = 50
+
+
+class FakeFireflyState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.accounts = []
+        # id de compte -> [transaction (format API)]
+        self.transactions = {}
+        self.hashes = set()
+        self.next_id = 1
+        self.requests = 0
+        self.injected_errors = 0
+
+    def _new_id(self):
+        new_id = str(self.next_id)
+        self.next_id += 1
+        return new_id
+
+    def create_account(self, attributes):
+        with self.lock:
+            account = {'id': self._new_id(), 'type': 'accounts', 'attributes': dict(attributes)}
+            self.accounts.append(account)
+            self.transactions[account['id']] = []
+            return account
+
+    def create_transaction(self, payload):
+        """Retourne la transaction créée, ou None si error_if_duplicate_hash la refuse"""
+        splits = payload['transactions']
+        transaction_hash = json.dumps(splits, sort_keys=True)
+        with self.lock:
+            if payload.get('error_if_duplicate_hash') and transaction_hash in self.hashes:
+                return None
+            self.hashes.add(transaction_hash)
+            transaction = {'id': self._new_id(), 'type': 'transactions', 'attributes': {'transactions': splits}}
+            for account_id in {split.get('source_id') for split in splits} | {split.get('destination_id') for split in splits}:
+                if account_id in self.transactions:
+                    self.transactions[account_id].append(transaction)
+            return transaction
+
+    def account_transactions(self, account_id, start, end):
+        with self.lock:
+            transactions = list(self.transactions.get(account_id, ()))
+        if start or end:
+            transactions = [
+                transaction for transaction in transactions
+                if (not start or transaction['attributes']['transactions'][0]['date'][:10] >= start)
+                and (not end or transaction['attributes']['transactions'][0]['date'][:10] <= end)
+            ]
+        return transactions
+
+
+def paginated(items, page):
+    total_pages = max(1, (len(items) + PAGE_SIZE - 1) // PAGE_SIZE)
+    return {
+        'data': items[(page - 1) * PAGE_SIZE:page * PAGE_SIZE],
+        'meta': {'pagination': {
+            'total': len(items), 'count': len(items[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]), 'per_page': PAGE_SIZE,
+            'current_page': page, 'total_pages': total_pages, 'has_more_pages': page < total_pages,
+        }},
+    }
+
+
+class FakeFireflyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # En-têtes et corps partent en deux envois : sans TCP_NODELAY, Nagle et l'ACK retardé
+    # ajouteraient ~40 ms à chaque requête et le benchmark mesurerait le faux serveur
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _intercept(self):
+        """Latence et erreurs injectées ; retourne True si la requête a reçu une erreur"""
+        server = self.server
+        with server.state.lock:
+            server.state.requests += 1
+            draw = server.rng.random()
+        if server.latency:
+            time.sleep(server.latency)
+        if draw < server.error_rate:
+            with server.state.lock:
+                server.state.injected_errors += 1
+            # Moitié 429 (avec Retry-After), moitié 503
+            if draw < server.error_rate / 2:
+                self._send(429, {'message': 'Too Many Attempts.'}, {'Retry-After': '0'})
+            else:
+                self._send(503, {'message': 'Service Unavailable'})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._intercept():
+            return
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        page = int(query.get('page', 1))
+        parts = url.path.strip('/').split('/')
+        state = self.server.state
+        if parts == ['api', 'v1', 'accounts']:
+            with state.lock:
+                accounts = [account for account in state.accounts if not query.get('type') or account['attributes'].get('type') == query['type']]
+            self._send(200, paginated(accounts, page))
+        elif len(parts) == 5 and parts[:3] == ['api', 'v1', 'accounts'] and parts[4] == 'transactions':
+            self._send(200, paginated(state.account_transactions(parts[3], query.get('start'), query.get('end')), page))
+        else:
+            self._send(404, {'message': 'Not found'})
+
+    def do_POST(self):
+        # Corps lu avant toute réponse, erreurs injectées comprises, pour garder la connexion réutilisable
+        payload = self._read_json()
+        if self._intercept():
+            return
+        path = urlparse(self.path).path.rstrip('/')
+        state = self.server.state
+        if path == '/api/v1/accounts':
+            self._send(200, {'data': state.create_account(payload)})
+        elif path == '/api/v1/transactions':
+            transaction = state.create_transaction(payload)
+            if transaction is None:
+                self._send(422, {'message': 'Duplicate of transaction #0.', 'errors': {'transactions.0.description': ['Duplicate of transaction #0.']}})
+            else:
+                self._send(200, {'data': transaction})
+        else:
+            self._send(404, {'message': 'Not found'})
+
+
+class FakeFirefly:
+    """Serveur HTTP local sur un port libre, exécuté dans un thread"""
+
+    def __init__(self, latency_ms=0.0, error_rate=0.0, seed=42):
+        self.state = FakeFireflyState()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeFireflyHandler)
+        self.server.daemon_threads = True
+        self.server.state = self.state
+        self.server.latency = latency_ms / 1000
+        self.server.error_rate = error_rate
+        self.server.rng = random.Random(seed)
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
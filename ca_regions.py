@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import threading
+import urllib.parse
+from datetime import datetime, timedelta
+
+from constant import DATA_DIR_DEFAULT
+
+REGION_CACHE_FILE = 'ca_regions.json'
+REGION_CACHE_TTL_DAYS_DEFAULT = 30
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search.php'
+NOMINATIM_TIMEOUT = 10
+# Nominatim exige un User-Agent identifiant l'application
+NOMINATIM_USER_AGENT = 'firefly-iii-credit-agricole-importer'
+
+logger = logging.getLogger(__name__)
+
+
+def _authenticator_class():
+    # creditagricole_particuliers n'est chargé qu'à la première authentification :
+    # les tables de régions s'utilisent sans la pile réseau
+    from creditagricole_particuliers import Authenticator
+
+    class CreditAgricoleAuthenticator(Authenticator):
+        def __init__(self, username, password, ca_region):
+            """custom authenticator class"""
+            self.url = "https://www.credit-agricole.fr"
+            self.ssl_verify = True
+            self.username = username
+            self.password = password
+            self.department = "none"
+            self.regional_bank_url = "ca-" + ca_region
+            self.cookies = None
+
+            self.authenticate()
+
+    return CreditAgricoleAuthenticator
+
+
+def __getattr__(name):
+    # CreditAgricoleAuthenticator reste importable depuis ce module, la classe étant créée à la demande
+    if name == 'CreditAgricoleAuthenticator':
+        authenticator_class = globals()[name] = _authenticator_class()
+        return authenticator_class
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class RegionLocationCache:
+    """Coordonnées des caisses régionales, conservées sur disque pendant ttl_days.
+
+    Une entrée expirée est redemandée à Nominatim, mais reste utilisée si le réseau est
+    indisponible : la résolution fonctionne hors ligne dès la première exécution réussie."""
+
+    def __init__(self, path, ttl_days=REGION_CACHE_TTL_DAYS_DEFAULT):
+        self.path = path
+        self.ttl = timedelta(days=ttl_days)
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, encoding='utf-8') as cache_file:
+                    self.entries = json.load(cache_file)
+            except (OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            temporary_path = self.path + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(self.entries, cache_file, ensure_ascii=False, indent=1)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logger.warning(f"Impossible d'enregistrer le cache des régions : {str(e)}")
+
+    def _entry(self, ca_region):
+        """(entrée, date de géocodage) de la région, ou (None, None) si absente ou illisible"""
+        entry = self._load().get(ca_region)
+        try:
+            fetched_at = datetime.fromisoformat(entry['fetched_at'])
+            entry['longitude'], entry['latitude']
+        except (KeyError, TypeError, ValueError):
+            if entry is not None:
+                logger.warning(f"Entrée illisible pour la région {ca_region} dans {self.path}, nouveau géocodage")
+            return None, None
+        return entry, fetched_at
+
+    def location(self, ca_region, address):
+        """(longitude, latitude) de la région, depuis le cache ou Nominatim"""
+        with self.lock:
+            entry, fetched_at = self._entry(ca_region)
+            if entry and datetime.now() - fetched_at < self.ttl:
+                return entry['longitude'], entry['latitude']
+            try:
+                longitude, latitude = geocode(address)
+            except Exception as e:
+                if entry:
+                    logger.warning(f"Géocodage de {address} impossible ({str(e)}), coordonnées en cache utilisées")
+                    return entry['longitude'], entry['latitude']
+                raise
+            self.entries[ca_region] = {
+                'longitude': longitude,
+                'latitude': latitude,
+                'fetched_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            self._save()
+            return longitude, latitude
+
+
+# Un cache par fichier, partagé par les régions résolues dans le processus
+_location_caches = {}
+_location_caches_lock = threading.Lock()
+
+
+def location_cache(config=None):
+    """Cache des coordonnées dans le répertoire de données de la configuration (data_dir)"""
+    data_dir = config.get('GlobalSettings', 'data_dir', fallback=DATA_DIR_DEFAULT) if config else DATA_DIR_DEFAULT
+    path = os.path.join(data_dir, REGION_CACHE_FILE)
+    with _location_caches_lock:
+        if path not in _location_caches:
+            _location_caches[path] = RegionLocationCache(path)
+        return _location_caches[path]
+
+
+def geocode(address):
+    import requests
+
+    url = NOMINATIM_URL + '?q=' + urllib.parse.quote(address) + '&format=jsonv2'
+    response = requests.get(url, headers={'User-Agent': NOMINATIM_USER_AGENT}, timeout=NOMINATIM_TIMEOUT)
+    response.raise_for_status()
+    results = response.json()
+    if len(results) > 0 and "lon" in results[0] and "lat" in results[0]:
+        return str(results[0]['lon']), str(results[0]['lat'])
+    # Absence de résultat mise en cache elle aussi : inutile de redemander avant l'expiration
+    return None, None
+
+
+class CreditAgricoleRegion:
+
+    def __init__(self, ca_region, config=None, cache=None):
+
+        self.name = CA_REGIONS[ca_region]
+
+        # Find the bank region location (cached on disk in data_dir, see RegionLocationCache)
+        address = "Credit Agricole " + self.name + ", France"
+        cache = cache or location_cache(config)
+        self.longitude, self.latitude = cache.location(ca_region, address)
+
+    @staticmethod
+    def get_ca_region(department_id: str):
+        if department_id in CA_REGIONS:
+            return [department_id]
+        return DEPARTMENT_REGIONS.get(normalize_department(department_id))
+
+
+CA_REGIONS = {
+    "alpesprovence": "Alpes Provence",
+    "alsace-vosges": "Alsace Vosges",
+    "anjou-maine": "Anjou Maine",
+    "aquitaine": "Aquitaine",
+    "atlantique-vendee": "Atlantique Vendée",
+    "briepicardie": "Brie Picardie",
+    "centrest": "Centre Est",
+    "centrefrance": "Centre France",
+    "centreloire": "Centre Loire",
+    "centreouest": "Centre Ouest",
+    "cb": "Champagne Bourgogne",
+    "cmds": "Charente Maritime Deux-Sèvres",
+    "charente-perigord": "Charente Périgord",
+    "corse": "Corse",
+    "cotesdarmor": "Côtes d'Armor",
+    "des-savoie": "Des Savoie",
+    "finistere": "Finistère",
+    "franchecomte": "Franche Comté",
+    "guadeloupe": "Guadeloupe",
+    "illeetvilaine": "Ille et Vilaine",
+    "languedoc": "Languedoc",
+    "loirehauteloire": "Loire Haute-Loire",
+    "lorraine": "Lorraine",
+    "martinique": "Martinique",
+    "morbihan": "Morbihan",
+    "norddefrance": "Nord de France",
+    "nord-est": "Nord Est",
+    "nmp": "Nord Midi Pyrénées",
+    "normandie": "Normandie",
+    "normandie-seine": "Normandie Seine",
+    "paris": "Paris",
+    "pca": "Provence Côte d'Azur",
+    "pyrenees-gascogne": "Pyrénées Gascogne",
+    "reunion": "Réunion",
+    "sudmed": "Sud Méditerranée",
+    "sudrhonealpes": "Sud Rhône Alpes",
+    "toulouse31": "Toulouse",
+    "tourainepoitou": "Touraine Poitou",
+    "valdefrance": "Val de France",
+}
+
+DEPARTMENTS_TO_CA_REGIONS = {
+    ('20', '2A', '2B'): ['corse'],
+    ('1', '71'): ['centrest'],
+    ('2', '8', '51'): ['nord-est'],
+    ('4', '6', '83'): ['pca'],
+    ('5', '13', '84'): ['alpesprovence'],
+    ('10', '21', '52', '89'): ['cb'],
+    ('11', '30', '34', '48'): ['languedoc'],
+    ('12', '46', '81', '82'): ['nmp'],
+    ('14', '50'): ['normandie'],
+    ('53', '61'): ['normandie', 'anjou-maine'],
+    ('15', '23', '63', '03', '19'): ['centrefrance'],
+    ('16', '24'): ['charente-perigord'],
+    ('17', '79'): ['cmds'],
+    ('18', '58'): ['centreloire'],
+    ('56',): ['morbihan'],
+    ('45',): ['briepicardie', 'centreloire'],
+    ('22',): ['cotesdarmor'],
+    ('25', '39', '70', '90'): ['franchecomte'],
+    ('26', '38', '69', '7'): ['centrest', 'sudrhonealpes'],
+    ('27', '76'): ['normandie-seine'],
+    ('28', '41'): ['valdefrance'],
+    ('29',): ['finistere'],
+    ('31',): ['toulouse31'],
+    ('32',): ['aquitaine', 'pyrenees-gascogne'],
+    ('33', '40', '47'): ['aquitaine'],
+    ('35',): ['illeetvilaine'],
+    ('36', '87'): ['centreouest'],
+    ('37', '86'): ['tourainepoitou'],
+    ('54', '55', '57'): ['lorraine'],
+    ('67', '68', '88'): ['alsace-vosges'],
+    ('42', '43'): ['loirehauteloire'],
+    ('44', '85'): ['atlantique-vendee'],
+    ('49', '72'): ['anjou-maine'],
+    ('59', '62'): ['norddefrance'],
+    ('64', '65'): ['pyrenees-gascogne'],
+    ('66', '9'): ['sudmed'],
+    ('73', '74'): ['des-savoie'],
+    ('75', '91', '92', '93', '94', '95', '78'): ['paris'],
+    ('60',): ['briepicardie', 'paris'],
+    ('80', '77'): ['briepicardie'],
+    ('971',): ['guadeloupe'],
+    ('972', '973'): ['martinique'],
+    ('974',): ['reunion']
+}
+
+
+def normalize_department(department_id):
+    # "03" et "3" désignent le même département
+    return str(int(department_id)) if department_id.isdigit() else department_id.upper()
+
+
+def _index_departments(table):
+    departments = {}
+    for department_ids, regions in table.items():
+        for department_id in department_ids:
+            # Comme l'ancien parcours de la table, la première entrée d'un département l'emporte
+            departments.setdefault(normalize_department(department_id), regions)
+    return departments
+
+
+# Département -> caisses régionales, calculé une fois au chargement du module
+DEPARTMENT_REGIONS = _index_departments(DEPARTMENTS_TO_CA_REGIONS)
@@ -1,5 +1,7 @@
 # --------- CONFIG FILE -------- #
 CONFIG_FILE = "config.ini"
+# ---------- DATA VOLUME ---------- #
+DATA_DIR_DEFAULT = "/app/data"
 # ---------- SETTINGS ---------- #
 SETTINGS_SECTION = "GlobalSettings"
 SAVE_LOGS_FIELD = "save-logs"
@@ -9,7 +11,8 @@ MAX_LOG_FILES_DEFAULT = "0"
 DEBUG_FIELD = "debug"
 DEBUG_DEFAULT = "False"
 AUTO_DETECT_TRANSFERS_FIELD = "auto-detect-transfers"
-AUTO_DETECT_TRANSFERS_DEFAULT = "True"
+# Désactivé par défaut : la détection conserve en mémoire les opérations de tous les comptes avant l'envoi
+AUTO_DETECT_TRANSFERS_DEFAULT = "False"
 # --------- CREDIT AGRICOLE -------- #
 CREDIT_AGRICOLE_SECTION = "CreditAgricole"
 BANK_DEPARTMENT_FIELD = "bank-department"
@@ -1,27 +1,65 @@
 from datetime import datetime, timedelta
 
-from creditagricole_particuliers import Authenticator, Accounts
-from creditagricole_particuliers.operations import Operations
 from constant import *
-import urllib.parse
-import requests
+import hashlib
+import json
+import os
 import re
+import threading
 import logging
-from urllib.parse import urljoin
 
+# creditagricole_particuliers et requests sont importés à la demande, dans les méthodes qui
+# effectuent des requêtes : la validation de la configuration ne charge pas la pile réseau
 
-class CreditAgricoleAuthenticator(Authenticator):
-    def __init__(self, username, password, ca_region):
-        """custom authenticator class"""
-        self.url = "https://www.credit-agricole.fr"
-        self.ssl_verify = True
-        self.username = username
-        self.password = password
-        self.department = "none"
-        self.regional_bank_url = "ca-" + ca_region
-        self.cookies = None
 
-        self.authenticate()
+STREAM_CHUNK_DAYS_DEFAULT = 7
+SESSION_CACHE_FILE = 'ca_session.json'
+SESSION_TTL_MINUTES_DEFAULT = 90
+# Statuts HTTP d'une session refusée, tels qu'ils apparaissent dans les erreurs de la bibliothèque
+AUTH_ERROR_STATUS = re.compile(r'\b(401|403)\b')
+
+
+def split_date_range(date_start, date_stop, window_days):
+    """Découpe [date_start, date_stop] (YYYY-MM-DD, bornes incluses) en fenêtres contiguës"""
+    if window_days < 1:
+        # Une fenêtre vide ne ferait jamais avancer le découpage
+        raise ValueError(f"Taille de fenêtre invalide : {window_days} jours (minimum 1)")
+    windows = []
+    start = datetime.strptime(date_start, "%Y-%m-%d")
+    stop = datetime.strptime(date_stop, "%Y-%m-%d")
+    while start <= stop:
+        end = min(start + timedelta(days=window_days - 1), stop)
+        windows.append((start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")))
+        start = end + timedelta(days=1)
+    return windows
+
+
+def is_authentication_error(error):
+    """Vrai si l'erreur d'une requête bancaire signale une session refusée.
+
+    Une session expirée renvoie la page de connexion au lieu du JSON attendu, ou un statut 401/403 ;
+    une erreur réseau ou un 5xx de la banque ne justifie pas une nouvelle connexion au clavier."""
+    if isinstance(error, ValueError):
+        return True
+    import requests
+    if isinstance(error, requests.RequestException):
+        return False
+    return bool(AUTH_ERROR_STATUS.search(str(error)))
+
+
+class CachedAuthenticator:
+    def __init__(self, session_state):
+        """authenticator restored from a previous login, without keypad authentication
+        (exposes the attributes read by Accounts and Operations)"""
+        import requests
+
+        self.url = session_state['url']
+        self.ssl_verify = session_state['ssl_verify']
+        self.username = None
+        self.password = None
+        self.department = session_state['department']
+        self.regional_bank_url = session_state['regional_bank_url']
+        self.cookies = requests.utils.cookiejar_from_dict(session_state['cookies'])
 
 
 class CreditAgricoleClient:
@@ -32,6 +70,12 @@ class CreditAgricoleClient:
         self.username = config.get('CreditAgricole', 'username')
         self.password = self.parse_password(config.get('CreditAgricole', 'password'))
         self.session = None
+        self.session_from_cache = False
+        self.session_created_at = None
+        self._login_lock = threading.Lock()
+        data_dir = config.get('GlobalSettings', 'data_dir', fallback=DATA_DIR_DEFAULT)
+        self.session_cache_path = os.path.join(data_dir, SESSION_CACHE_FILE)
+        self.session_ttl = timedelta(minutes=config.getint('CreditAgricole', 'session_ttl_minutes', fallback=SESSION_TTL_MINUTES_DEFAULT))
 
     def parse_password(self, password_string):
         return [int(char) for char in password_string if char.isdigit()]
@@ -60,7 +104,14 @@ class CreditAgricoleClient:
             raise ValueError(f"Invalid department number: {self.department}. It should be a two-digit number.")
         self.log_message('info', "Credentials validated")
 
-    def init_session(self):
+    @property
+    def session_cache_enabled(self):
+        # session_ttl_minutes = 0 : aucune session conservée, ni en mémoire ni sur disque
+        return self.session_ttl > timedelta(0)
+
+    def init_session(self, use_cache=True):
+        if use_cache and self.session_cache_enabled and self.load_cached_session():
+            return
         try:
             username = self.config.get('CreditAgricole', 'username')
             password = self.config.get('CreditAgricole', 'password')
@@ -70,15 +121,98 @@ class CreditAgricoleClient:
     
             password_list = [int(char) for char in password]
             
+            from creditagricole_particuliers import Authenticator
+            
             self.session = Authenticator(
                 username=username,
                 password=password_list,
                 department=department
             )
+            self.session_from_cache = False
+            self.session_created_at = datetime.now()
             self.logger.info("Session Crédit Agricole initialisée avec succès")
         except Exception as e:
             self.logger.error(f"Erreur lors de l'initialisation de la session : {str(e)}")
             raise
+        if self.session_cache_enabled:
+            self.save_session()
+        else:
+            # Cookies éventuellement laissés par une configuration précédente
+            self.invalidate_session_cache()
+
+    def ensure_session(self):
+        """Ouvre une session si nécessaire ; une session encore valide est conservée (mode démon)"""
+        if self.session and self.session_created_at and datetime.now() - self.session_created_at < self.session_ttl:
+            # Session potentiellement expirée côté banque : une reconnexion aura lieu en cas de refus
+            self.session_from_cache = True
+            return
+        self.init_session()
+
+    def _session_owner(self):
+        # La session en cache n'est réutilisée que pour le même identifiant
+        return hashlib.sha256(self.config.get('CreditAgricole', 'username').encode()).hexdigest()
+
+    def load_cached_session(self):
+        try:
+            with open(self.session_cache_path, encoding='utf-8') as cache_file:
+                session_state = json.load(cache_file)
+        except (OSError, ValueError):
+            return False
+        try:
+            created_at = datetime.fromisoformat(session_state['created_at'])
+            if session_state['owner'] != self._session_owner() or datetime.now() - created_at > self.session_ttl:
+                self.logger.info("Session Crédit Agricole en cache expirée")
+                return False
+            self.session = CachedAuthenticator(session_state)
+            self.session_created_at = created_at
+        except (KeyError, TypeError, ValueError) as e:
+            self.logger.warning(f"Session Crédit Agricole en cache illisible, nouvelle connexion : {str(e)}")
+            return False
+        self.session_from_cache = True
+        self.logger.info("Session Crédit Agricole réutilisée depuis le cache")
+        return True
+
+    def save_session(self):
+        import requests
+
+        session_state = {
+            'owner': self._session_owner(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'url': self.session.url,
+            'ssl_verify': self.session.ssl_verify,
+            'department': self.session.department,
+            'regional_bank_url': self.session.regional_bank_url,
+            'cookies': requests.utils.dict_from_cookiejar(self.session.cookies or {}),
+        }
+        try:
+            os.makedirs(os.path.dirname(self.session_cache_path), exist_ok=True)
+            # Fichier lisible uniquement par l'utilisateur courant : il contient les cookies de session
+            fd = os.open(self.session_cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as cache_file:
+                json.dump(session_state, cache_file)
+            os.chmod(self.session_cache_path, 0o600)
+        except OSError as e:
+            self.logger.warning(f"Impossible d'enregistrer la session Crédit Agricole en cache : {str(e)}")
+
+    def invalidate_session_cache(self):
+        try:
+            os.remove(self.session_cache_path)
+        except FileNotFoundError:
+            pass
+
+    def _call_with_session(self, request):
+        """Exécute une requête bancaire ; si la session en cache est refusée, se reconnecte et réessaie"""
+        try:
+            return request()
+        except Exception as e:
+            if not self.session_from_cache or not is_authentication_error(e):
+                raise
+            self.logger.warning(f"Session Crédit Agricole en cache refusée ({str(e)}), nouvelle connexion")
+            with self._login_lock:
+                if self.session_from_cache:
+                    self.invalidate_session_cache()
+                    self.init_session(use_cache=False)
+            return request()
 
     def get_accounts(self):
         self.logger.info("Récupération des comptes")
@@ -88,22 +222,61 @@ class CreditAgricoleClient:
         
         try:
             self.logger.info("Récupération des comptes")
-            accounts = Accounts(session=self.session)
+            from creditagricole_particuliers import Accounts
+            accounts = self._call_with_session(lambda: Accounts(session=self.session))
             return list(accounts)  # Convertit l'itérable en liste
         except Exception as e:
             self.logger.error(f"Erreur lors de la récupération des comptes : {str(e)}")
             raise
 
+    def get_transactions_window(self):
+        """Fenêtre d'import (date_start, date_stop) au format YYYY-MM-DD"""
+        period_days = int(getattr(self, 'get_transactions_period', 30) or 30)
+        now = datetime.now()
+        return (now - timedelta(days=period_days)).strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d")
+
+    def iter_accounts(self):
+        """Variante générateur de get_accounts : les comptes sont transmis au fil de la lecture"""
+        self.logger.info("Récupération des comptes")
+        if not self.session:
+            self.logger.error("Session not initialized")
+            raise ValueError("Session not initialized. Call init_session() first.")
+        
+        try:
+            from creditagricole_particuliers import Accounts
+            accounts = self._call_with_session(lambda: Accounts(session=self.session))
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la récupération des comptes : {str(e)}")
+            raise
+        yield from accounts
+
     def get_transactions(self, account, date_start=None, date_stop=None):
         self.logger.info("Récupération des transactions")
+        return list(self._operations(account, date_start, date_stop))  # Convertit l'itérable en liste
+
+    def iter_transactions(self, account, date_start=None, date_stop=None, chunk_days=None):
+        """Variante générateur de get_transactions : la période est lue par tranches de chunk_days jours,
+        seule la tranche en cours est gardée en mémoire"""
+        self.logger.info("Récupération des transactions (flux)")
+        date_start, date_stop = self._resolve_window(date_start, date_stop)
+        chunk_days = max(1, chunk_days or int(getattr(self, 'stream_chunk_days', STREAM_CHUNK_DAYS_DEFAULT)))
+        for chunk_start, chunk_stop in split_date_range(date_start, date_stop, chunk_days):
+            self.logger.debug(f"Récupération des transactions du {chunk_start} au {chunk_stop}")
+            yield from self._operations(account, chunk_start, chunk_stop)
+
+    def _resolve_window(self, date_start, date_stop):
+        if date_start is None or date_stop is None:
+            default_start, default_stop = self.get_transactions_window()
+            date_start = date_start or default_start
+            date_stop = date_stop or default_stop
+        return date_start, date_stop
+
+    def _operations(self, account, date_start, date_stop):
         if not self.session:
             self.logger.error("Session not initialized")
             raise ValueError("Session not initialized. Call init_session() first.")
         
-        if date_start is None:
-            date_start = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
-        if date_stop is None:
-            date_stop = datetime.now().strftime("%Y-%m-%d")
+        date_start, date_stop = self._resolve_window(date_start, date_stop)
         
         try:
             # Extraction de compteIdx et grandeFamilleCode depuis l'objet account
@@ -113,19 +286,18 @@ class CreditAgricoleClient:
             # Logs pour vérifier les valeurs
             self.logger.debug(f"compteIdx: {compteIdx}, grandeFamilleCode: {grandeFamilleCode}")
 
-            operations = Operations(
+            from creditagricole_particuliers.operations import Operations
+            return self._call_with_session(lambda: Operations(
                 session=self.session,
                 compteIdx=compteIdx,
                 grandeFamilleCode=grandeFamilleCode,
                 date_start=date_start,
                 date_stop=date_stop
-            )
-            return list(operations)  # Convertit l'itérable en liste
+            ))
         except Exception as e:
             self.logger.error(f"Erreur lors de la récupération des transactions : {str(e)}")
             raise
 
-
     def close_session(self):
         if self.session:
             try:
@@ -135,119 +307,3 @@ class CreditAgricoleClient:
                 self.log_message('error', f"Failed to close session: {str(e)}")
         else:
             self.log_message('warning', "No active session to close")
-            
-class CreditAgricoleRegion:
-
-    def __init__(self, ca_region):
-
-        self.name = CA_REGIONS[ca_region]
-        self.longitude = None
-        self.latitude = None
-
-        # Find the bank region location
-        address = "Credit Agricole " + self.name + ", France"
-        url = 'https://nominatim.openstreetmap.org/search.php?q=' + urllib.parse.quote(address) + '&format=jsonv2'
-        response = requests.get(url).json()
-        if len(response) > 0 and "lon" in response[0] and "lat" in response[0]:
-            self.longitude = str(response[0]['lon'])
-            self.latitude = str(response[0]['lat'])
-
-    @staticmethod
-    def get_ca_region(department_id: str):
-        if department_id in CA_REGIONS.keys():
-            return [department_id]
-        department_id = str(int(department_id)) if department_id.isdigit() else department_id
-        for key, value in DEPARTMENTS_TO_CA_REGIONS.items():
-            if department_id in key:
-                return value
-        return None
-
-
-CA_REGIONS = {
-    "alpesprovence": "Alpes Provence",
-    "alsace-vosges": "Alsace Vosges",
-    "anjou-maine": "Anjou Maine",
-    "aquitaine": "Aquitaine",
-    "atlantique-vendee": "Atlantique Vendée",
-    "briepicardie": "Brie Picardie",
-    "centrest": "Centre Est",
-    "centrefrance": "Centre France",
-    "centreloire": "Centre Loire",
-    "centreouest": "Centre Ouest",
-    "cb": "Champagne Bourgogne",
-    "cmds": "Charente Maritime Deux-Sèvres",
-    "charente-perigord": "Charente Périgord",
-    "corse": "Corse",
-    "cotesdarmor": "Côtes d'Armor",
-    "des-savoie": "Des Savoie",
-    "finistere": "Finistère",
-    "franchecomte": "Franche Comté",
-    "guadeloupe": "Guadeloupe",
-    "illeetvilaine": "Ille et Vilaine",
-    "languedoc": "Languedoc",
-    "loirehauteloire": "Loire Haute-Loire",
-    "lorraine": "Lorraine",
-    "martinique": "Martinique",
-    "morbihan": "Morbihan",
-    "norddefrance": "Nord de France",
-    "nord-est": "Nord Est",
-    "nmp": "Nord Midi Pyrénées",
-    "normandie": "Normandie",
-    "normandie-seine": "Normandie Seine",
-    "paris": "Paris",
-    "pca": "Provence Côte d'Azur",
-    "pyrenees-gascogne": "Pyrénées Gascogne",
-    "reunion": "Réunion",
-    "sudmed": "Sud Méditerranée",
-    "sudrhonealpes": "Sud Rhône Alpes",
-    "toulouse31": "Toulouse",
-    "tourainepoitou": "Touraine Poitou",
-    "valdefrance": "Val de France",
-}
-
-DEPARTMENTS_TO_CA_REGIONS = {
-    ('20', '2A', '2B'): ['corse'],
-    ('1', '71'): ['centrest'],
-    ('2', '8', '51'): ['nord-est'],
-    ('4', '6', '83'): ['pca'],
-    ('5', '13', '84'): ['alpesprovence'],
-    ('10', '21', '52', '89'): ['cb'],
-    ('11', '30', '34', '48'): ['languedoc'],
-    ('12', '46', '81', '82'): ['nmp'],
-    ('14', '50'): ['normandie'],
-    ('53', '61'): ['normandie', 'anjou-maine'],
-    ('15', '23', '63', '03', '19'): ['centrefrance'],
-    ('16', '24'): ['charente-perigord'],
-    ('17', '79'): ['cmds'],
-    ('18', '58'): ['centreloire'],
-    ('56',): ['morbihan'],
-    ('45',): ['briepicardie', 'centreloire'],
-    ('22',): ['cotesdarmor'],
-    ('25', '39', '70', '90'): ['franchecomte'],
-    ('26', '38', '69', '7'): ['centrest', 'sudrhonealpes'],
-    ('27', '76'): ['normandie-seine'],
-    ('28', '41'): ['valdefrance'],
-    ('29',): ['finistere'],
-    ('31',): ['toulouse31'],
-    ('32',): ['aquitaine', 'pyrenees-gascogne'],
-    ('33', '40', '47'): ['aquitaine'],
-    ('35',): ['illeetvilaine'],
-    ('36', '87'): ['centreouest'],
-    ('37', '86'): ['tourainepoitou'],
-    ('54', '55', '57'): ['lorraine'],
-    ('67', '68', '88'): ['alsace-vosges'],
-    ('42', '43'): ['loirehauteloire'],
-    ('44', '85'): ['atlantique-vendee'],
-    ('11', '30', '34', '48',): ['languedoc'],
-    ('49', '72'): ['anjou-maine'],
-    ('59', '62'): ['norddefrance'],
-    ('64', '65'): ['pyrenees-gascogne'],
-    ('66', '9'): ['sudmed'],
-    ('73', '74'): ['des-savoie'],
-    ('75', '91', '92', '93', '94', '95', '78'): ['paris'],
-    ('60',): ['briepicardie', 'paris'],
-    ('80', '77'): ['briepicardie'],
-    ('971',): ['guadeloupe'],
-    ('972', '973'): ['martinique'],
-    ('974',): ['reunion']
-}
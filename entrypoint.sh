@@ -2,6 +2,12 @@
 
 echo "Starting entrypoint script"
 
+# Daemon mode: a single long-running process schedules the imports itself
+if [ "${RUN_MODE:-cron}" = "daemon" ]; then
+    echo "Starting main.py in daemon mode"
+    exec python /app/main.py --daemon
+fi
+
 # Function to execute the Python script
 run_script() {
     echo "Running main.py"
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+EXPORT_DIR = 'exports'
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_FORMAT_DEFAULT = 'ndjson'
+# Identifiant provisoire d'un compte absent de Firefly lors d'une simulation (aucun compte n'est créé)
+EXPORT_ACCOUNT_PREFIX = 'export:'
+
+ACCOUNT_RECORD = 'account'
+TRANSACTION_RECORD = 'transaction'
+CSV_FIELDS = (
+    'record', 'account_number', 'account_name', 'account_balance', 'account_currency',
+    'type', 'date', 'amount', 'description', 'external_id', 'counterpart_account_number', 'internal_reference',
+    'category_name', 'budget_name', 'tags', 'source_name', 'destination_name',
+)
+# Champs facultatifs du split Firefly conservés tels quels
+OPTIONAL_SPLIT_FIELDS = ('internal_reference', 'category_name', 'budget_name', 'source_name', 'destination_name')
+TAGS_SEPARATOR = '|'
+
+logger = logging.getLogger(__name__)
+
+
+class ExportedAccount:
+    """Compte lu dans un export, avec les attributs utilisés pour le créer dans Firefly"""
+
+    def __init__(self, record):
+        self.numeroCompte = record['account_number']
+        self.account = {
+            'libelleProduit': record.get('account_name') or 'Compte sans nom',
+            'solde': record.get('account_balance') or '0.00',
+            'libelleDevise': record.get('account_currency') or 'EUR',
+        }
+
+
+class TransactionExporter:
+    """Écrit au fil de l'eau, en NDJSON ou CSV, les transactions qui auraient été envoyées à Firefly.
+
+    Chaque compte est décrit par une ligne « account » avant ses transactions : le fichier suffit
+    pour rejouer l'import (--replay) dans une instance Firefly vierge, sans interroger la banque."""
+
+    def __init__(self, data_dir, export_format=EXPORT_FORMAT_DEFAULT):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Format d'export inconnu : {export_format} (attendu : {', '.join(EXPORT_FORMATS)})")
+        export_dir = os.path.join(data_dir, EXPORT_DIR)
+        os.makedirs(export_dir, exist_ok=True)
+        self.path = os.path.join(export_dir, f"transactions-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}")
+        self.export_format = export_format
+        self.lock = threading.Lock()
+        self.accounts = {}
+        self.count = 0
+        self.export_file = open(self.path, 'w', encoding='utf-8', newline='')
+        self.csv_writer = None
+        if export_format == 'csv':
+            self.csv_writer = csv.DictWriter(self.export_file, fieldnames=CSV_FIELDS)
+            self.csv_writer.writeheader()
+        logger.info(f"Simulation : les transactions sont exportées vers {self.path} au lieu d'être envoyées à Firefly")
+
+    def _write(self, record):
+        if self.csv_writer:
+            self.csv_writer.writerow(dict(record, tags=TAGS_SEPARATOR.join(record.get('tags', ()))))
+        else:
+            self.export_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def add_account(self, firefly_account_id, ca_account):
+        solde = ca_account.account.get('solde') or ca_account.account.get('valorisation') or ca_account.account.get('balance') or '0.00'
+        with self.lock:
+            self.accounts[firefly_account_id] = ca_account.numeroCompte
+            self._write({
+                'record': ACCOUNT_RECORD,
+                'account_number': ca_account.numeroCompte,
+                'account_name': ca_account.account.get('libelleProduit', 'Compte sans nom'),
+                'account_balance': str(solde),
+                'account_currency': ca_account.account.get('libelleDevise', 'EUR'),
+            })
+
+    def transaction_record(self, transaction_data):
+        split = transaction_data['transactions'][0]
+        account_id = split['destination_id'] if split['type'] == 'deposit' else split['source_id']
+        record = {
+            'record': TRANSACTION_RECORD,
+            'account_number': self.accounts[account_id],
+            'type': split['type'],
+            'date': split['date'],
+            'amount': split['amount'],
+            'description': split['description'],
+            'external_id': split['external_id'],
+            'tags': split.get('tags', []),
+        }
+        if split['type'] == 'transfer':
+            record['counterpart_account_number'] = self.accounts[split['destination_id']]
+        for field in OPTIONAL_SPLIT_FIELDS:
+            if split.get(field):
+                record[field] = split[field]
+        return record
+
+    def write_all(self, pending):
+        """Exporte les transactions (clé, transaction) ; retourne leur nombre"""
+        count = 0
+        for transaction_key, transaction_data in pending:
+            record = self.transaction_record(transaction_data)
+            with self.lock:
+                self._write(record)
+                self.count += 1
+            count += 1
+        return count
+
+    def close(self):
+        with self.lock:
+            self.export_file.close()
+        logger.info(f"{self.count} transactions exportées vers {self.path}")
+
+
+def read_records(path):
+    """Enregistrements d'un export (NDJSON ou CSV selon l'extension), lus au fil de l'eau"""
+    with open(path, encoding='utf-8', newline='') as export_file:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(export_file):
+                record = {field: value for field, value in row.items() if value}
+                record['tags'] = row['tags'].split(TAGS_SEPARATOR) if row.get('tags') else []
+                yield record
+        else:
+            for line_number, line in enumerate(export_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ligne {line_number} illisible ignorée dans {path}")
+
+
+def record_payload(record, account_id, counterpart_account_id=None):
+    """Transaction Firefly reconstruite à partir d'un enregistrement exporté"""
+    transaction_type = record['type']
+    split = {
+        "type": transaction_type,
+        "date": record['date'],
+        "amount": record['amount'],
+        "description": record['description'],
+        "source_id": account_id if transaction_type != 'deposit' else None,
+        "destination_id": counterpart_account_id if transaction_type == 'transfer' else account_id if transaction_type == 'deposit' else None,
+        "external_id": record['external_id'],
+    }
+    for field in OPTIONAL_SPLIT_FIELDS:
+        if record.get(field):
+            split[field] = record[field]
+    if record.get('tags'):
+        split['tags'] = record['tags']
+    return {"error_if_duplicate_hash": True, "transactions": [split]}
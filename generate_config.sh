@@ -7,16 +7,26 @@ update_section() {
     local key=$2
     local value=$3
     
-    if ! grep -q "\[$section\]" "$CONFIG_FILE"; then
+    if ! grep -q "^\[$section\]" "$CONFIG_FILE"; then
         echo "" >> "$CONFIG_FILE"
         echo "[$section]" >> "$CONFIG_FILE"
     fi
     
-    if grep -q "^$key\s*=" "$CONFIG_FILE"; then
-        sed -i "s|^$key\s*=.*|$key = $value|" "$CONFIG_FILE"
-    else
-        echo "$key = $value" >> "$CONFIG_FILE"
-    fi
+    # La clé n'est cherchée que dans sa section : enabled et rules existent dans plusieurs sections.
+    # Valeurs passées par l'environnement, pour qu'awk n'interprète pas les antislashs
+    SECTION="[$section]" KEY="$key" VALUE="$value" awk '
+        BEGIN { line = ENVIRON["KEY"] " = " ENVIRON["VALUE"] }
+        /^\[.*\]/ {
+            if (in_section && !done) { print line; done = 1 }
+            in_section = ($0 == ENVIRON["SECTION"])
+        }
+        in_section && index($0, ENVIRON["KEY"]) == 1 && substr($0, length(ENVIRON["KEY"]) + 1) ~ /^[ \t]*=/ {
+            if (!done) { print line; done = 1 }
+            next
+        }
+        { print }
+        END { if (in_section && !done) print line }
+    ' "$CONFIG_FILE" > "$CONFIG_FILE.tmp" && mv "$CONFIG_FILE.tmp" "$CONFIG_FILE"
 }
 
 > "$CONFIG_FILE"
@@ -24,16 +34,42 @@ update_section() {
 # GlobalSettings
 update_section "GlobalSettings" "debug" "${DEBUG:-false}"
 update_section "GlobalSettings" "dry_run" "${DRY_RUN:-false}"
+update_section "GlobalSettings" "export_format" "${EXPORT_FORMAT:-ndjson}"
+update_section "GlobalSettings" "data_dir" "${DATA_DIR:-/app/data}"
+update_section "GlobalSettings" "reconcile" "${RECONCILE:-false}"
+update_section "GlobalSettings" "account_concurrency" "${ACCOUNT_CONCURRENCY:-3}"
+update_section "GlobalSettings" "schedule" "${SCHEDULE:-0 8 * * *}"
+update_section "GlobalSettings" "schedule_interval_minutes" "${SCHEDULE_INTERVAL_MINUTES:-0}"
+update_section "GlobalSettings" "auto_detect_transfers" "${AUTO_DETECT_TRANSFERS:-false}"
+update_section "GlobalSettings" "transfer_date_tolerance_days" "${TRANSFER_DATE_TOLERANCE_DAYS:-2}"
+update_section "GlobalSettings" "transfer_label_similarity" "${TRANSFER_LABEL_SIMILARITY:-0}"
+update_section "GlobalSettings" "metrics_textfile" "${METRICS_TEXTFILE:-}"
+update_section "GlobalSettings" "profiles_dir" "${PROFILES_DIR:-}"
+update_section "GlobalSettings" "profile_concurrency" "${PROFILE_CONCURRENCY:-2}"
 
 # FireflyIII
 update_section "FireflyIII" "url" "${FIREFLY_III_URL}"
 update_section "FireflyIII" "personal_access_token" "${FIREFLY_PERSONAL_ACCESS_TOKEN}"
+update_section "FireflyIII" "window_margin_days" "${FIREFLY_WINDOW_MARGIN_DAYS:-3}"
+update_section "FireflyIII" "import_concurrency" "${FIREFLY_IMPORT_CONCURRENCY:-4}"
+update_section "FireflyIII" "connect_timeout" "${FIREFLY_CONNECT_TIMEOUT:-5}"
+update_section "FireflyIII" "read_timeout" "${FIREFLY_READ_TIMEOUT:-60}"
+update_section "FireflyIII" "max_retries" "${FIREFLY_MAX_RETRIES:-5}"
+update_section "FireflyIII" "backoff_factor" "${FIREFLY_BACKOFF_FACTOR:-0.5}"
+update_section "FireflyIII" "backoff_max" "${FIREFLY_BACKOFF_MAX:-30}"
+update_section "FireflyIII" "retry_after_max" "${FIREFLY_RETRY_AFTER_MAX:-300}"
 
 # CreditAgricole
 update_section "CreditAgricole" "username" "${CREDIT_AGRICOLE_USERNAME}"
 update_section "CreditAgricole" "password" "${CREDIT_AGRICOLE_PASSWORD}"
 DEPARTMENT="${CREDIT_AGRICOLE_DEPARTMENT:-31}"
 update_section "CreditAgricole" "department" "${DEPARTMENT}"
+update_section "CreditAgricole" "get_transactions_period_days" "${GET_TRANSACTIONS_PERIOD_DAYS:-30}"
+update_section "CreditAgricole" "watermark_overlap_days" "${WATERMARK_OVERLAP_DAYS:-3}"
+update_section "CreditAgricole" "backfill_window_days" "${BACKFILL_WINDOW_DAYS:-90}"
+update_section "CreditAgricole" "backfill_concurrency" "${BACKFILL_CONCURRENCY:-2}"
+update_section "CreditAgricole" "stream_chunk_days" "${STREAM_CHUNK_DAYS:-7}"
+update_section "CreditAgricole" "session_ttl_minutes" "${CREDIT_AGRICOLE_SESSION_TTL_MINUTES:-90}"
 
 # AutoRenameTransaction
 update_section "AutoRenameTransaction" "enabled" "${AUTO_RENAME_ENABLED:-false}"
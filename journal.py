@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+
+JOURNAL_FILE = 'journal.jsonl'
+
+PLANNED = 'planned'
+COMMITTED = 'committed'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+class ImportJournal:
+    """Journal append-only des transactions envoyées à Firefly (une ligne JSON par événement).
+
+    Chaque transaction est journalisée avant l'envoi (planned) puis clôturée selon la réponse de
+    Firefly (committed ou failed). Après un arrêt brutal, les entrées restées « planned » sont
+    celles dont le sort est inconnu : elles sont rejouées au démarrage suivant."""
+
+    def __init__(self, data_dir):
+        os.makedirs(data_dir, exist_ok=True)
+        self.path = os.path.join(data_dir, JOURNAL_FILE)
+        self.lock = threading.Lock()
+        self.journal_file = open(self.path, 'a', encoding='utf-8')
+        # Une écriture interrompue laisse une ligne incomplète : la suite du journal repart sur une nouvelle ligne
+        if self.journal_file.tell() and not self._ends_with_newline():
+            self.journal_file.write('\n')
+            self.journal_file.flush()
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as journal_file:
+            journal_file.seek(-1, os.SEEK_END)
+            return journal_file.read(1) == b'\n'
+
+    def _append(self, record):
+        with self.lock:
+            self.journal_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            # flush à chaque ligne : le journal survit à l'arrêt du processus (redémarrage du conteneur)
+            self.journal_file.flush()
+
+    def plan(self, account_id, external_id, transaction_data):
+        self._append({'event': PLANNED, 'account_id': str(account_id), 'external_id': external_id, 'payload': transaction_data})
+
+    def commit(self, external_id):
+        self._append({'event': COMMITTED, 'external_id': external_id})
+
+    def fail(self, external_id):
+        # Un échec clôture l'entrée : l'opération sera de nouveau proposée par la fenêtre d'import suivante
+        self._append({'event': FAILED, 'external_id': external_id})
+
+    def pending(self):
+        """Entrées planifiées sans issue connue, dans l'ordre du journal"""
+        with self.lock:
+            self.journal_file.flush()
+            entries = {}
+            with open(self.path, encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Dernière ligne tronquée par un arrêt brutal
+                        logger.warning("Ligne illisible ignorée dans le journal d'import")
+                        continue
+                    if record.get('event') == PLANNED:
+                        entries[record['external_id']] = record
+                    else:
+                        entries.pop(record.get('external_id'), None)
+        return list(entries.values())
+
+    def compact(self):
+        """Réécrit le journal avec les seules entrées en attente"""
+        remaining = self.pending()
+        with self.lock:
+            self.journal_file.close()
+            temporary_path = self.path + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as journal_file:
+                for record in remaining:
+                    journal_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            os.replace(temporary_path, self.path)
+            self.journal_file = open(self.path, 'a', encoding='utf-8')
+        return len(remaining)
+
+    def close(self):
+        with self.lock:
+            self.journal_file.close()
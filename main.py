@@ -1,32 +1,84 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import time
+START_TIME = time.perf_counter()
+
+import argparse
 import configparser
+import fcntl
 import logging
+import multiprocessing
+import os
+import signal
 import sys
-from creditagricole import CreditAgricoleClient
-import firefly_iii_client
-import urllib3
-import requests
-from datetime import datetime
-from dateutil import parser
+import threading
+from creditagricole import CreditAgricoleClient, split_date_range, STREAM_CHUNK_DAYS_DEFAULT
+from state import StateStore
+from constant import DATA_DIR_DEFAULT
+from scheduler import load_schedule, run_forever
+from normalize import dedup_key, operation_fingerprint, EXTERNAL_ID_PREFIX
+from journal import ImportJournal
+from rules import RuleEngine
+from transfers import TransferDetector, split_account_id
+from metrics import RunMetrics, write_reports
+from export import (TransactionExporter, ExportedAccount, EXPORT_ACCOUNT_PREFIX, EXPORT_FORMATS, EXPORT_FORMAT_DEFAULT,
+                    ACCOUNT_RECORD, read_records, record_payload)
+from profiles import (PROFILE_CONCURRENCY_DEFAULT, profile_paths, load_profile, aggregate_reports,
+                      write_profiles_report)
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+from datetime import datetime, timedelta
+from itertools import islice
+
+# requests, urllib3 et creditagricole_particuliers sont importés à la demande,
+# uniquement sur les chemins qui en ont besoin (voir --check-config)
 
 # Constants
 CONFIG_FILE = '/app/config.ini'
+FIREFLY_WINDOW_MARGIN_DAYS_DEFAULT = 3
+IMPORT_CONCURRENCY_DEFAULT = 4
+ACCOUNT_CONCURRENCY_DEFAULT = 3
+WATERMARK_OVERLAP_DAYS_DEFAULT = 3
+BACKFILL_WINDOW_DAYS_DEFAULT = 90
+BACKFILL_CONCURRENCY_DEFAULT = 2
+SCHEDULE_DEFAULT = '0 8 * * *'
+RUN_LOCK_FILE = 'importer.lock'
 
 # Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Préfixe de compte propre à chaque thread de traitement, pour garder des logs lisibles en parallèle
+_log_context = threading.local()
+# Préfixe du profil traité par le processus (exécution multi-profils)
+_log_profile = ''
+
+class AccountPrefixFilter(logging.Filter):
+    def filter(self, record):
+        record.account_prefix = _log_profile + getattr(_log_context, 'prefix', '')
+        return True
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(account_prefix)s%(message)s')
+for handler in logging.getLogger().handlers:
+    handler.addFilter(AccountPrefixFilter())
 logger = logging.getLogger(__name__)
 
 def mask_sensitive_info(text):
     masked_text = ' '.join(['XXXXXXXX' + s[-4:] if s.isdigit() and len(s) > 8 else 'XXX.XX' if '.' in s and s.replace('.', '', 1).isdigit() else s for s in text.split()])
     return masked_text
 
-def load_config():
+def load_config(config_file=None):
     config = configparser.ConfigParser()
-    config.read(CONFIG_FILE)
+    config.read(config_file or CONFIG_FILE)
     return config
 
+def init_state(config):
+    data_dir = config.get('GlobalSettings', 'data_dir', fallback=DATA_DIR_DEFAULT)
+    state = StateStore(data_dir)
+    logger.info(f"Index local de dédoublonnage ouvert : {state.path}")
+    return state
+
 def init_firefly_client(config):
+    import urllib3
+    from transport import (RetryingSession, CONNECT_TIMEOUT_DEFAULT, READ_TIMEOUT_DEFAULT, MAX_RETRIES_DEFAULT,
+                           BACKOFF_FACTOR_DEFAULT, BACKOFF_MAX_DEFAULT, RETRY_AFTER_MAX_DEFAULT)
     try:
         firefly_section = config['FireflyIII']
         url = firefly_section.get('url')
@@ -34,7 +86,18 @@ def init_firefly_client(config):
         if not url or not personal_access_token:
             raise ValueError("URL ou token d'accès personnel manquant dans la configuration FireflyIII.")
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        session = requests.Session()
+        # Le pool de connexions couvre toutes les requêtes simultanées (comptes x envois par compte)
+        import_concurrency = max(1, config.getint('FireflyIII', 'import_concurrency', fallback=IMPORT_CONCURRENCY_DEFAULT))
+        account_concurrency = max(1, config.getint('GlobalSettings', 'account_concurrency', fallback=ACCOUNT_CONCURRENCY_DEFAULT))
+        session = RetryingSession(
+            pool_size=import_concurrency * account_concurrency,
+            connect_timeout=firefly_section.getfloat('connect_timeout', fallback=CONNECT_TIMEOUT_DEFAULT),
+            read_timeout=firefly_section.getfloat('read_timeout', fallback=READ_TIMEOUT_DEFAULT),
+            max_retries=firefly_section.getint('max_retries', fallback=MAX_RETRIES_DEFAULT),
+            backoff_factor=firefly_section.getfloat('backoff_factor', fallback=BACKOFF_FACTOR_DEFAULT),
+            backoff_max=firefly_section.getfloat('backoff_max', fallback=BACKOFF_MAX_DEFAULT),
+            retry_after_max=firefly_section.getfloat('retry_after_max', fallback=RETRY_AFTER_MAX_DEFAULT)
+        )
         session.headers.update({
             'Authorization': f"Bearer {personal_access_token}",
             'Content-Type': 'application/json',
@@ -52,10 +115,19 @@ class FireflyIIIClient:
         self.base_url = base_url
         self.session = session
 
-    def get_accounts(self):
-        response = self.session.get(f"{self.base_url}/api/v1/accounts")
-        response.raise_for_status()
-        return response.json()['data']
+    def get_accounts(self, account_type=None):
+        accounts = []
+        page = 1
+        params = {'type': account_type} if account_type else {}
+        while True:
+            response = self.session.get(f"{self.base_url}/api/v1/accounts", params={**params, 'page': page})
+            response.raise_for_status()
+            data = response.json()
+            accounts.extend(data.get('data', []))
+            if not data.get('meta', {}).get('pagination', {}).get('has_more_pages', False):
+                break
+            page += 1
+        return accounts
 
     def create_account(self, account_data):
         response = self.session.post(f"{self.base_url}/api/v1/accounts", json=account_data)
@@ -67,30 +139,47 @@ class FireflyIIIClient:
         response.raise_for_status()
         return response.json()['data']
 
-    def get_transactions(self, account_id):
-        transactions = []
+    def get_transactions(self, account_id, start=None, end=None):
+        transactions = list(self.iter_transactions(account_id, start, end))
+        logger.info(f"{len(transactions)} transactions récupérées pour le compte Firefly ID {account_id}")
+        return transactions
+
+    def iter_transactions(self, account_id, start=None, end=None):
+        """Variante générateur de get_transactions : une seule page est gardée en mémoire"""
         page = 1
+        params = {}
+        if start:
+            params['start'] = start
+        if end:
+            params['end'] = end
         while True:
-            response = self.session.get(f"{self.base_url}/api/v1/accounts/{account_id}/transactions?page={page}")
+            response = self.session.get(f"{self.base_url}/api/v1/accounts/{account_id}/transactions", params={**params, 'page': page})
             response.raise_for_status()
             data = response.json()
             if 'data' not in data:
                 logger.warning(f"Aucune donnée de transaction retournée pour le compte Firefly ID: {account_id}")
                 break
-            transactions.extend(data['data'])
+            yield from data['data']
             if not data['meta']['pagination'].get('has_more_pages', False):
                 break
             page += 1
-        logger.info(f"{len(transactions)} transactions récupérées pour le compte Firefly ID {account_id}")
-        return transactions
 
-def get_or_create_firefly_account(firefly_client, ca_account):
+def build_firefly_account_index(firefly_client):
+    account_index = {}
+    for account in firefly_client.get_accounts(account_type='asset'):
+        account_number = account['attributes'].get('account_number')
+        if account_number:
+            account_index[account_number] = account['id']
+    logger.info(f"{len(account_index)} comptes Firefly indexés par numéro de compte")
+    return account_index
+
+def get_or_create_firefly_account(firefly_client, ca_account, account_index):
+    import requests
     try:
-        firefly_accounts = firefly_client.get_accounts()
-        for account in firefly_accounts:
-            if account['attributes'].get('account_number') == ca_account.numeroCompte:
-                logger.info(f"Compte Firefly existant trouvé pour {mask_sensitive_info(ca_account.numeroCompte)}")
-                return account['id']
+        account_id = account_index.get(ca_account.numeroCompte)
+        if account_id:
+            logger.info(f"Compte Firefly existant trouvé pour {mask_sensitive_info(ca_account.numeroCompte)}")
+            return account_id
         
         solde = ca_account.account.get('solde') or ca_account.account.get('valorisation') or ca_account.account.get('balance') or '0.00'
         
@@ -109,6 +198,7 @@ def get_or_create_firefly_account(firefly_client, ca_account):
         }
         
         new_account = firefly_client.create_account(new_account_data)
+        account_index[ca_account.numeroCompte] = new_account['id']
         
         logger.info(f"Nouveau compte Firefly créé pour {mask_sensitive_info(ca_account.numeroCompte)} avec solde masqué {mask_sensitive_info(str(solde))}")
         
@@ -122,15 +212,525 @@ def get_or_create_firefly_account(firefly_client, ca_account):
         logger.error(f"Erreur inconnue lors de la création/récupération du compte Firefly : {str(e)}")
         return None
 
-def main():
+def firefly_window(date_start, date_stop, margin_days):
+    start = datetime.strptime(date_start, "%Y-%m-%d") - timedelta(days=margin_days)
+    end = datetime.strptime(date_stop, "%Y-%m-%d") + timedelta(days=margin_days)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+def firefly_transaction_keys(existing_transactions):
+    for tx in existing_transactions:
+        # Récupérer les attributs nécessaires depuis le sous-ensemble 'transactions'
+        transaction_details = tx['attributes'].get('transactions', [])
+        
+        if not transaction_details:
+            logger.warning(f"Transaction sans détails trouvée et ignorée : {tx}")
+            continue
+
+        for detail in transaction_details:
+            date = detail.get('date')
+            amount = detail.get('amount')
+            description = detail.get('description')
+
+            # Les transactions déjà importées par cet importeur sont reconnues par leur empreinte ;
+            # les autres (saisies manuelles, anciens imports, external_id posé par un autre outil)
+            # par leur clé standardisée
+            external_id = detail.get('external_id') or ''
+            if external_id.startswith(EXTERNAL_ID_PREFIX):
+                yield external_id, None
+                # Virement entre comptes importés : l'opération de l'autre compte est portée par internal_reference
+                internal_reference = detail.get('internal_reference') or ''
+                if internal_reference.startswith(EXTERNAL_ID_PREFIX):
+                    yield internal_reference, None
+                continue
+
+            # Standardiser les champs (date YYYY-MM-DD, montant au centime, libellé nettoyé)
+            if date and amount and description:
+                transaction_tuple = dedup_key(date, amount, description)
+                logger.debug(f"Transaction existante ajoutée pour comparaison : {transaction_tuple}")
+                yield None, transaction_tuple
+            else:
+                # Enregistrer un message d'avertissement avec plus de détails sur la transaction incomplète
+                logger.warning(f"Transaction incomplète ignorée lors de la comparaison des doublons : {detail}")
+
+def ca_transaction_key(transaction):
+    # Même normalisation que pour les transactions Firefly
+    return dedup_key(transaction.dateOp, transaction.montantOp, transaction.libelleOp)
+
+def pending_transactions(state, firefly_account_id, account_number, transactions, stats, rule_engine=None, stop_event=None):
+    occurrences = {}
+    for transaction in transactions:
+        if stop_event and stop_event.is_set():
+            # Arrêt demandé : la lecture bancaire s'interrompt, le watermark n'avancera pas
+            logger.info("Arrêt demandé : lecture des opérations interrompue")
+            return
+        montant = transaction.montantOp
+        transaction_key = ca_transaction_key(transaction)
+        standardized_date, standardized_amount, libelle = transaction_key
+        
+        # Empreinte stable de l'opération, envoyée comme external_id
+        occurrence = occurrences.get(transaction_key, 0)
+        occurrences[transaction_key] = occurrence + 1
+        external_id = operation_fingerprint(account_number, transaction_key, occurrence)
+        
+        # Suivi du volume lu et de la date d'opération la plus récente (watermark)
+        stats['seen'] += 1
+        if standardized_date > stats['last_date']:
+            stats['last_date'] = standardized_date
+        
+        # Vérification des doublons avant l'importation
+        if state.contains_external_id(firefly_account_id, external_id) or state.contains(firefly_account_id, transaction_key):
+            masked_transaction_key = tuple(mask_sensitive_info(str(item)) for item in transaction_key)
+            logger.info(f"Doublon détecté pour la transaction : {masked_transaction_key}. Ignorée.")
+            continue
+
+        transaction_data = {
+            # Firefly refuse la transaction (422) si une transaction identique, external_id compris, existe déjà
+            "error_if_duplicate_hash": True,
+            "transactions": [{
+                "type": "withdrawal" if montant < 0 else "deposit",
+                "date": standardized_date,
+                "amount": standardized_amount,
+                "description": libelle,
+                "source_id": firefly_account_id if montant < 0 else None,
+                "destination_id": firefly_account_id if montant >= 0 else None,
+                "external_id": external_id,
+            }]
+        }
+        
+        # Règles AutoRename / AutoAssign, évaluées sur le libellé bancaire d'origine
+        if rule_engine:
+            rule_engine.apply(transaction_data["transactions"][0], libelle)
+        
+        yield transaction_key, transaction_data
+
+def is_duplicate_error(error):
+    from transport import is_duplicate_response
+    response = error.response
+    return response is not None and is_duplicate_response(response)
+
+def submit_transactions(firefly_client, pending, concurrency, on_success=None, on_failure=None, metrics=None, stop_event=None):
+    """Envoie les transactions à Firefly via un pool de threads borné, retourne (importées, échecs)
+
+    Si stop_event est positionné, aucune nouvelle transaction n'est envoyée ; celles en cours se terminent."""
+    import requests
+    create_transaction = firefly_client.create_transaction
+    if metrics:
+        create_transaction = lambda transaction_data: metrics.timed_call('firefly_create_transaction', firefly_client.create_transaction, transaction_data)
+    imported_count = 0
+    failed_count = 0
+    in_flight = {}
+
+    def collect(return_when):
+        nonlocal imported_count, failed_count
+        done, _ = wait(in_flight, return_when=return_when)
+        for future in done:
+            transaction_key, transaction_data = in_flight.pop(future)
+            masked_transaction_key = tuple(mask_sensitive_info(str(item)) for item in transaction_key)
+            try:
+                future.result()
+            except requests.HTTPError as e:
+                if not is_duplicate_error(e):
+                    logger.error(f"Erreur lors de l'importation de la transaction {masked_transaction_key}: {str(e)}")
+                    failed_count += 1
+                    if on_failure:
+                        on_failure(transaction_key, transaction_data)
+                    continue
+                # Déjà présente dans Firefly : enregistrée dans l'index local sans être comptée comme importée
+                logger.info(f"Doublon signalé par Firefly pour la transaction : {masked_transaction_key}. Ignorée.")
+            except requests.RequestException as e:
+                logger.error(f"Erreur lors de l'importation de la transaction {masked_transaction_key}: {str(e)}")
+                failed_count += 1
+                if on_failure:
+                    on_failure(transaction_key, transaction_data)
+                continue
+            else:
+                imported_count += 1
+            if on_success:
+                on_success(transaction_key, transaction_data)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for transaction_key, transaction_data in pending:
+            if stop_event and stop_event.is_set():
+                # Transaction déjà journalisée le cas échéant : elle sera rejouée à la prochaine exécution
+                logger.info("Arrêt demandé : envoi des transactions interrompu")
+                break
+            in_flight[executor.submit(create_transaction, transaction_data)] = (transaction_key, transaction_data)
+            # Limite le nombre de requêtes en attente pour ne pas tout charger en mémoire
+            if len(in_flight) >= concurrency * 2:
+                collect(FIRST_COMPLETED)
+        if in_flight:
+            collect(ALL_COMPLETED)
+    if metrics:
+        metrics.increment('transactions_imported', imported_count)
+        metrics.increment('transactions_failed', failed_count)
+    return imported_count, failed_count
+
+class ImportContext:
+    """Paramètres et clients partagés par les traitements de comptes d'une exécution"""
+
+    def __init__(self, config, ca_cli, firefly_client, state, journal, account_index, rule_engine, metrics, exporter=None, stop_event=None):
+        self.config = config
+        self.ca_cli = ca_cli
+        self.firefly_client = firefly_client
+        self.state = state
+        self.journal = journal
+        self.rule_engine = rule_engine
+        self.account_index = account_index
+        self.metrics = metrics
+        # Simulation : les transactions sont exportées au lieu d'être envoyées (None sinon)
+        self.exporter = exporter
+        # Positionné par SIGTERM/SIGINT : lectures et envois s'arrêtent au plus tôt
+        self.stop_event = stop_event or threading.Event()
+        self.account_lock = threading.Lock()
+
+        self.reconcile = config.getboolean('GlobalSettings', 'reconcile', fallback=False)
+
+        # Fenêtre d'import par défaut, utilisée pour les comptes sans watermark
+        self.date_start, self.date_stop = ca_cli.get_transactions_window()
+        self.firefly_margin_days = config.getint('FireflyIII', 'window_margin_days', fallback=FIREFLY_WINDOW_MARGIN_DAYS_DEFAULT)
+        self.watermark_overlap_days = config.getint('CreditAgricole', 'watermark_overlap_days', fallback=WATERMARK_OVERLAP_DAYS_DEFAULT)
+
+        self.import_concurrency = max(1, config.getint('FireflyIII', 'import_concurrency', fallback=IMPORT_CONCURRENCY_DEFAULT))
+        self.account_concurrency = max(1, config.getint('GlobalSettings', 'account_concurrency', fallback=ACCOUNT_CONCURRENCY_DEFAULT))
+
+        self.backfill_window_days = max(1, config.getint('CreditAgricole', 'backfill_window_days', fallback=BACKFILL_WINDOW_DAYS_DEFAULT))
+        self.backfill_concurrency = max(1, config.getint('CreditAgricole', 'backfill_concurrency', fallback=BACKFILL_CONCURRENCY_DEFAULT))
+
+        # Rapprochement des virements entre comptes (None si désactivé)
+        self.transfer_detector = TransferDetector.from_config(config)
+
+def resolve_firefly_account(context, account):
+    if not account.account:
+        logger.warning(f"Le compte {mask_sensitive_info(account.numeroCompte)} n'a pas d'informations de compte disponibles. Il sera ignoré.")
+        return None
+    
+    solde = account.account.get('solde') or account.account.get('valorisation') or account.account.get('balance') or '0.00'
+    
+    libelle_devise = account.account.get('libelleDevise', 'Devise inconnue')
+    
+    logger.info(f"Traitement du compte:... {mask_sensitive_info(account.numeroCompte)} - Solde masqué: {mask_sensitive_info(str(solde))} {libelle_devise}")
+    
+    # Verrou : deux comptes ne doivent pas créer le même compte Firefly en parallèle
+    with context.account_lock:
+        if context.exporter and account.numeroCompte not in context.account_index:
+            # Simulation : aucun compte n'est créé, toutes les opérations du compte sont exportées
+            logger.info(f"Compte {mask_sensitive_info(account.numeroCompte)} absent de Firefly : il sera créé lors du rejeu de l'export")
+            firefly_account_id = EXPORT_ACCOUNT_PREFIX + account.numeroCompte
+        else:
+            firefly_account_id = get_or_create_firefly_account(context.firefly_client, account, context.account_index)
+    
+    if not firefly_account_id:
+        logger.error(f"Impossible de traiter le compte {mask_sensitive_info(account.numeroCompte)}: échec de création/récupération dans Firefly")
+    elif context.exporter:
+        context.exporter.add_account(firefly_account_id, account)
+    return firefly_account_id
+
+def seed_dedup_index(context, firefly_account_id, firefly_start, firefly_end, force=False):
+    state = context.state
+    if str(firefly_account_id).startswith(EXPORT_ACCOUNT_PREFIX):
+        # Compte absent de Firefly (simulation) : aucun historique à comparer
+        return
+    if context.reconcile:
+        # Réconciliation : reconstruction de l'index local à partir de tout l'historique Firefly
+        logger.info("Récupération de l'historique complet des transactions dans Firefly")
+        existing_transactions = context.firefly_client.iter_transactions(firefly_account_id)
+        with context.metrics.phase('dedup_index'):
+            state.seed(firefly_account_id, firefly_transaction_keys(context.metrics.timed_iter('firefly_get_transactions', existing_transactions)))
+    elif force or not state.is_seeded(firefly_account_id):
+        # Premier passage : seule la fenêtre d'import est nécessaire au dédoublonnage
+        logger.info("Récupération des transactions existantes dans Firefly sur la fenêtre d'import")
+        existing_transactions = context.firefly_client.iter_transactions(firefly_account_id, start=firefly_start, end=firefly_end)
+        with context.metrics.phase('dedup_index'):
+            state.seed(firefly_account_id, firefly_transaction_keys(context.metrics.timed_iter('firefly_get_transactions', existing_transactions)))
+    else:
+        logger.info("Index local de dédoublonnage utilisé, historique Firefly non téléchargé")
+
+def payload_external_id(transaction_data):
+    return transaction_data['transactions'][0]['external_id']
+
+def payload_index_entries(transaction_data):
+    """(compte Firefly, external_id) à enregistrer dans l'index local une fois la transaction envoyée"""
+    split = transaction_data['transactions'][0]
+    if split['type'] == 'transfer':
+        # Un virement couvre l'opération du compte source et celle du compte destination
+        return [(split['source_id'], split['external_id']), (split['destination_id'], split['internal_reference'])]
+    return [(split_account_id(split), split['external_id'])]
+
+def record_imported(context, transaction_data):
+    for firefly_account_id, external_id in payload_index_entries(transaction_data):
+        context.state.add_external_id(firefly_account_id, external_id)
+    context.journal.commit(payload_external_id(transaction_data))
+
+def send_transactions(context, pending, concurrency, on_failure=None):
+    if context.exporter:
+        # Simulation : export au lieu de l'envoi, sans journal ni mise à jour de l'index local
+        return context.exporter.write_all(pending), 0
+    
+    journal = context.journal
+
+    def journaled(pending):
+        # Chaque transaction est journalisée avant l'envoi, pour être rejouée après un arrêt brutal
+        for transaction_key, transaction_data in pending:
+            journal.plan(payload_index_entries(transaction_data)[0][0], payload_external_id(transaction_data), transaction_data)
+            yield transaction_key, transaction_data
+
+    def failed(transaction_key, transaction_data):
+        journal.fail(payload_external_id(transaction_data))
+        if on_failure:
+            on_failure(transaction_key, transaction_data)
+
+    return submit_transactions(
+        context.firefly_client, journaled(pending), concurrency,
+        on_success=lambda transaction_key, transaction_data: record_imported(context, transaction_data),
+        on_failure=failed,
+        metrics=context.metrics,
+        stop_event=context.stop_event
+    )
+
+def import_transactions(context, firefly_account_id, account_number, transactions, stats):
+    pending = pending_transactions(context.state, firefly_account_id, account_number, transactions, stats, context.rule_engine, context.stop_event)
+    return send_transactions(context, context.metrics.timed_iter('dedup', pending), context.import_concurrency)
+
+def replay_journal(context):
+    """Rejoue les transactions dont l'envoi a été interrompu lors d'une exécution précédente"""
+    entries = context.journal.pending()
+    if entries:
+        logger.info(f"Reprise du journal d'import : {len(entries)} transactions en attente")
+
+        # Les transactions déjà reçues par Firefly avant l'arrêt sont rejetées comme doublons (external_id)
+        imported_count, failed_count = submit_transactions(
+            context.firefly_client, (((entry['external_id'],), entry['payload']) for entry in entries),
+            context.import_concurrency,
+            on_success=lambda transaction_key, transaction_data: record_imported(context, transaction_data),
+            on_failure=lambda transaction_key, transaction_data: context.journal.fail(payload_external_id(transaction_data)),
+            metrics=context.metrics,
+            stop_event=context.stop_event
+        )
+        logger.info(f"Reprise du journal terminée : {imported_count} importées, {failed_count} en échec")
+    context.journal.compact()
+
+def replay_export(context, path):
+    """Envoie à Firefly les transactions d'un export (--replay) ; les comptes absents sont créés"""
+    account_ids = {}
+
+    def pending():
+        for record in read_records(path):
+            if record.get('record') == ACCOUNT_RECORD:
+                with context.account_lock:
+                    account_ids[record['account_number']] = get_or_create_firefly_account(context.firefly_client, ExportedAccount(record), context.account_index)
+                continue
+            account_id = account_ids.get(record['account_number'])
+            counterpart_account_id = account_ids.get(record.get('counterpart_account_number'))
+            if not account_id or (record['type'] == 'transfer' and not counterpart_account_id):
+                logger.warning(f"Transaction {record['external_id']} ignorée : compte Firefly introuvable")
+                continue
+            transaction_data = record_payload(record, account_id, counterpart_account_id)
+            # Transactions déjà importées (rejeu répété du même export) : ignorées sans requête
+            if all(context.state.contains_external_id(entry_account_id, external_id) for entry_account_id, external_id in payload_index_entries(transaction_data)):
+                continue
+            yield (record['date'], record['amount'], record['description']), transaction_data
+
+    # Sans lecture bancaire, toute la concurrence configurée sert à l'envoi
+    return send_transactions(context, context.metrics.timed_iter('replay', pending()), context.import_concurrency * context.account_concurrency)
+
+def advance_watermark(context, firefly_account_id, watermark, last_date, failed_count):
+    # Le watermark n'avance qu'après un import complet du compte
+    if context.exporter:
+        return
+    if context.stop_event.is_set():
+        # Import du compte possiblement incomplet : les opérations restantes seront relues
+        logger.info(f"Arrêt demandé : watermark conservé à {watermark or 'aucun'}")
+    elif failed_count:
+        logger.warning(f"{failed_count} transactions en échec : watermark conservé à {watermark or 'aucun'}")
+    elif last_date and last_date > (watermark or ''):
+        context.state.set_watermark(firefly_account_id, last_date)
+        logger.info(f"Watermark avancé au {last_date}")
+
+def open_import_window(context, firefly_account_id):
+    """Fenêtre d'import du compte, index de dédoublonnage prêt ; retourne (watermark, début, fin)"""
+    # Depuis le watermark (moins le recouvrement) ou fenêtre par défaut
+    date_start, date_stop = context.date_start, context.date_stop
+    watermark = context.state.get_watermark(firefly_account_id)
+    if watermark:
+        date_start = (datetime.strptime(watermark, "%Y-%m-%d") - timedelta(days=context.watermark_overlap_days)).strftime("%Y-%m-%d")
+    
+    # Fenêtre Firefly correspondante (avec marge de sécurité)
+    firefly_start, firefly_end = firefly_window(date_start, date_stop, context.firefly_margin_days)
+    logger.info(f"Fenêtre d'import : {date_start} -> {date_stop} (Firefly : {firefly_start} -> {firefly_end})")
+    
+    seed_dedup_index(context, firefly_account_id, firefly_start, firefly_end)
+    return watermark, date_start, date_stop
+
+def process_account(context, account):
+    _log_context.prefix = f"[{mask_sensitive_info(account.numeroCompte)}] "
     try:
-        logger.info("Démarrage de l'importation des données du Crédit Agricole")
+        firefly_account_id = resolve_firefly_account(context, account)
+        if not firefly_account_id:
+            return
         
-        config = load_config()
+        watermark, date_start, date_stop = open_import_window(context, firefly_account_id)
+        
+        # Les opérations sont transmises au dédoublonnage et à l'envoi au fil de leur lecture
+        transactions = context.metrics.timed_iter('ca_get_transactions', context.ca_cli.iter_transactions(account, date_start, date_stop))
+        
+        stats = {'seen': 0, 'last_date': ''}
+        imported_count, failed_count = import_transactions(context, firefly_account_id, account.numeroCompte, transactions, stats)
+        
+        logger.info(f"Transactions importées pour le compte {mask_sensitive_info(account.numeroCompte)}: {imported_count}/{stats['seen']}")
+        
+        advance_watermark(context, firefly_account_id, watermark, stats['last_date'], failed_count)
+    
+    except Exception as e:
+        logger.exception(f"Une erreur s'est produite lors de l'importation du compte {mask_sensitive_info(account.numeroCompte)}")
+    
+    finally:
+        _log_context.prefix = ''
+
+def prepare_account(context, account):
+    """Avec la détection des virements : opérations à importer du compte, conservées jusqu'au
+    rapprochement entre comptes ; retourne (numéro, compte Firefly, watermark, stats, transactions)"""
+    _log_context.prefix = f"[{mask_sensitive_info(account.numeroCompte)}] "
+    try:
+        firefly_account_id = resolve_firefly_account(context, account)
+        if not firefly_account_id:
+            return None
+        
+        watermark, date_start, date_stop = open_import_window(context, firefly_account_id)
+        
+        # Seules les opérations absentes de Firefly sont conservées en mémoire
+        transactions = context.metrics.timed_iter('ca_get_transactions', context.ca_cli.iter_transactions(account, date_start, date_stop))
+        stats = {'seen': 0, 'last_date': ''}
+        pending = list(context.metrics.timed_iter('dedup', pending_transactions(context.state, firefly_account_id, account.numeroCompte, transactions, stats, context.rule_engine, context.stop_event)))
+        
+        logger.info(f"Nouvelles transactions pour le compte {mask_sensitive_info(account.numeroCompte)}: {len(pending)}/{stats['seen']}")
+        return account.numeroCompte, firefly_account_id, watermark, stats, pending
+    
+    except Exception as e:
+        logger.exception(f"Une erreur s'est produite lors de l'importation du compte {mask_sensitive_info(account.numeroCompte)}")
+        return None
+    
+    finally:
+        _log_context.prefix = ''
+
+def import_with_transfers(context, prepared):
+    """Rapproche les virements entre comptes puis envoie toutes les transactions préparées"""
+    pending = [item for _, _, _, _, account_pending in prepared for item in account_pending]
+    with context.metrics.phase('transfer_detection', rows=len(pending)):
+        pending, transfer_count = context.transfer_detector.merge(pending)
+    context.metrics.increment('transfers_detected', transfer_count)
+    
+    failures = {}
+    
+    def on_failure(transaction_key, transaction_data):
+        for firefly_account_id, _ in payload_index_entries(transaction_data):
+            failures[firefly_account_id] = failures.get(firefly_account_id, 0) + 1
+    
+    # Un seul envoi pour tous les comptes, avec la concurrence cumulée des traitements de comptes
+    imported_count, failed_count = send_transactions(context, pending, context.import_concurrency * context.account_concurrency, on_failure=on_failure)
+    logger.info(f"Transactions importées : {imported_count}/{len(pending)} (dont {transfer_count} virements entre comptes)")
+    
+    for account_number, firefly_account_id, watermark, stats, _ in prepared:
+        _log_context.prefix = f"[{mask_sensitive_info(account_number)}] "
+        try:
+            advance_watermark(context, firefly_account_id, watermark, stats['last_date'], failures.get(firefly_account_id, 0))
+        finally:
+            _log_context.prefix = ''
+
+def backfill_account(context, account, since):
+    _log_context.prefix = f"[{mask_sensitive_info(account.numeroCompte)}] "
+    try:
+        firefly_account_id = resolve_firefly_account(context, account)
+        if not firefly_account_id:
+            return
+        
+        state = context.state
+        date_stop = datetime.now().strftime("%Y-%m-%d")
+        windows = split_date_range(since, date_stop, context.backfill_window_days)
+        
+        # Reprise : les fenêtres déjà importées lors d'une exécution interrompue sont ignorées
+        completed_until = state.get_backfill_progress(firefly_account_id, since)
+        if completed_until:
+            windows = [window for window in windows if window[1] > completed_until]
+            logger.info(f"Reprise du backfill après le {completed_until} : {len(windows)} fenêtres restantes")
+        else:
+            # Dédoublonnage sur toute la période du backfill
+            firefly_start, firefly_end = firefly_window(since, date_stop, context.firefly_margin_days)
+            seed_dedup_index(context, firefly_account_id, firefly_start, firefly_end, force=True)
+        
+        logger.info(f"Backfill de {since} à {date_stop} en {len(windows)} fenêtres de {context.backfill_window_days} jours")
         
-        ca_config = config['CreditAgricole']
+        def fetch(window):
+            _log_context.prefix = f"[{mask_sensitive_info(account.numeroCompte)}] "
+            with context.metrics.phase('ca_get_transactions'):
+                transactions = context.ca_cli.get_transactions(account, window[0], window[1])
+            context.metrics.add_rows('ca_get_transactions', len(transactions))
+            # Import dans l'ordre chronologique
+            return sorted(transactions, key=lambda transaction: ca_transaction_key(transaction)[0])
         
-        ca_cli = CreditAgricoleClient(config)
+        total_imported = 0
+        stats = {'seen': 0, 'last_date': ''}
+        with ThreadPoolExecutor(max_workers=context.backfill_concurrency) as executor:
+            # Les fenêtres suivantes sont récupérées pendant l'import de la fenêtre courante
+            fetches = deque()
+            remaining = iter(windows)
+            for window in islice(remaining, context.backfill_concurrency):
+                fetches.append((window, executor.submit(fetch, window)))
+            while fetches:
+                window, future = fetches.popleft()
+                transactions = future.result()
+                # Fenêtres importées l'une après l'autre, dans l'ordre des dates ; Firefly classe les
+                # transactions par date, l'ordre d'envoi au sein d'une fenêtre est sans importance
+                imported_count, failed_count = import_transactions(context, firefly_account_id, account.numeroCompte, transactions, stats)
+                total_imported += imported_count
+                logger.info(f"Fenêtre {window[0]} -> {window[1]} : {imported_count}/{len(transactions)} transactions importées")
+                if context.stop_event.is_set():
+                    # La fenêtre en cours, peut-être incomplète, sera reprise à la prochaine exécution
+                    logger.info(f"Arrêt demandé : backfill interrompu, reprise à la fenêtre {window[0]} -> {window[1]}")
+                    for _, pending_future in fetches:
+                        pending_future.cancel()
+                    return
+                if failed_count:
+                    # La fenêtre sera rejouée à la prochaine exécution (les doublons sont filtrés par l'index)
+                    logger.error(f"{failed_count} transactions en échec sur la fenêtre {window[0]} -> {window[1]} : backfill interrompu")
+                    for _, pending_future in fetches:
+                        pending_future.cancel()
+                    return
+                if not context.exporter:
+                    state.set_backfill_progress(firefly_account_id, since, window[1])
+                next_window = next(remaining, None)
+                if next_window:
+                    fetches.append((next_window, executor.submit(fetch, next_window)))
+        
+        logger.info(f"Backfill terminé pour le compte {mask_sensitive_info(account.numeroCompte)}: {total_imported}/{stats['seen']} transactions importées")
+        advance_watermark(context, firefly_account_id, state.get_watermark(firefly_account_id), stats['last_date'], 0)
+    
+    except Exception as e:
+        logger.exception(f"Une erreur s'est produite lors du backfill du compte {mask_sensitive_info(account.numeroCompte)}")
+    
+    finally:
+        _log_context.prefix = ''
+
+class Importer:
+    """Clients et état d'import, conservés entre les exécutions en mode démon"""
+
+    def __init__(self, config, stop_event=None):
+        self.config = config
+        self.ca_cli = None
+        self.firefly_client = None
+        self.account_index = None
+        self.state = None
+        self.journal = None
+        self.rule_engine = None
+        self.startup_seconds = None
+        self.last_report = None
+        self.dry_run = config.getboolean('GlobalSettings', 'dry_run', fallback=False)
+        self.run_lock = threading.Lock()
+        self.stop_event = stop_event or threading.Event()
+
+    def setup(self):
+        ca_config = self.config['CreditAgricole']
+        
+        ca_cli = CreditAgricoleClient(self.config)
         
         ca_cli.department = ca_config['department']
         
@@ -144,123 +744,408 @@ def main():
         
         ca_cli.max_transactions = ca_config.get('max_transactions_per_get', '300')
         
+        ca_cli.stream_chunk_days = max(1, ca_config.getint('stream_chunk_days', fallback=STREAM_CHUNK_DAYS_DEFAULT))
+        
         ca_cli.validate()
         
-        ca_cli.init_session()
+        self.ca_cli = ca_cli
         
-        logger.info("Client Crédit Agricole initialisé et session ouverte")
+        self.firefly_client = init_firefly_client(self.config)
         
-        accounts = ca_cli.get_accounts()
+        self.state = init_state(self.config)
         
-        logger.info(f"Nombre de comptes récupérés : {len(accounts)}")
+        self.journal = ImportJournal(self.state.data_dir)
         
-        firefly_client = init_firefly_client(config)
+        # Les règles sont compilées une fois pour toutes les exécutions
+        self.rule_engine = RuleEngine.from_config(self.config)
+        
+        # Temps écoulé depuis le lancement du script jusqu'à ce que l'importeur soit prêt
+        self.startup_seconds = time.perf_counter() - START_TIME
 
-        for account in accounts:
-            
-            if not account.account:
-                logger.warning(f"Le compte {mask_sensitive_info(account.numeroCompte)} n'a pas d'informations de compte disponibles. Il sera ignoré.")
-                continue
-            
-            solde = account.account.get('solde') or account.account.get('valorisation') or account.account.get('balance') or '0.00'
-            
-            libelle_devise = account.account.get('libelleDevise', 'Devise inconnue')
-            
-            logger.info(f"Traitement du compte:... {mask_sensitive_info(account.numeroCompte)} - Solde masqué: {mask_sensitive_info(str(solde))} {libelle_devise}")
-            
-            firefly_account_id = get_or_create_firefly_account(firefly_client, account)
-            
-            if not firefly_account_id:
-                logger.error(f"Impossible de traiter le compte {mask_sensitive_info(account.numeroCompte)}: échec de création/récupération dans Firefly")
-                continue
-            
-            # Collecte des transactions existantes dans Firefly
-            logger.info("Récupération des transactions existantes dans Firefly")
-            existing_transactions = firefly_client.get_transactions(firefly_account_id)
-
-            # Création de l'ensemble des transactions existantes pour la comparaison
-            existing_set = set()
-
-            for tx in existing_transactions:
-                # Récupérer les attributs nécessaires depuis le sous-ensemble 'transactions'
-                transaction_details = tx['attributes'].get('transactions', [])
-                
-                if not transaction_details:
-                    logger.warning(f"Transaction sans détails trouvée et ignorée : {tx}")
-                    continue
+    def run(self, backfill_since=None, replay_path=None):
+        # Une seule exécution à la fois, y compris entre processus (cron et démon)
+        if not self.run_lock.acquire(blocking=False):
+            logger.warning("Une importation est déjà en cours, exécution ignorée")
+            return
+        try:
+            with RunFileLock(self.state.data_dir) as acquired:
+                if not acquired:
+                    logger.warning("Une importation est déjà en cours dans un autre processus, exécution ignorée")
+                    return
+                self._run(backfill_since, replay_path)
+        except Exception as e:
+            logger.exception("Une erreur s'est produite lors de l'importation")
+        finally:
+            self.run_lock.release()
 
-                for detail in transaction_details:
-                    date = detail.get('date')
-                    amount = detail.get('amount')
-                    description = detail.get('description')
-
-                    # Standardiser les champs pour éviter les différences mineures
-                    if date and amount and description:
-                        # Convertir la date au format standard YYYY-MM-DD
-                        standardized_date = parser.parse(date).strftime("%Y-%m-%d")
-                        
-                        # Convertir le montant en float pour éviter les différences d'arrondi
-                        standardized_amount = f"{float(amount):.2f}"
-                        
-                        # Nettoyer la description en supprimant les espaces superflus
-                        standardized_description = description.strip()
-                        
-                        transaction_tuple = (standardized_date, standardized_amount, standardized_description)
-                        existing_set.add(transaction_tuple)
-                        logger.debug(f"Transaction existante ajoutée pour comparaison : {transaction_tuple}")
-                    else:
-                        # Enregistrer un message d'avertissement avec plus de détails sur la transaction incomplète
-                        logger.warning(f"Transaction incomplète ignorée lors de la comparaison des doublons : {detail}")
-            
-            logger.info(f"{len(existing_set)} transactions existantes chargées pour comparaison des doublons.")
-            
-            transactions = ca_cli.get_transactions(account)
-            
-            imported_count = 0
+    def _run(self, backfill_since, replay_path=None):
+        logger.info("Démarrage de l'importation des données du Crédit Agricole")
+        self.last_report = None
+        
+        metrics = RunMetrics()
+        http_stats_before = self.firefly_client.session.stats.as_dict()
+        
+        if not replay_path:
+            # Session bancaire réutilisée tant qu'elle est valide
+            with metrics.phase('ca_init_session'):
+                self.ca_cli.ensure_session()
             
-            for transaction in transactions:
+            logger.info("Client Crédit Agricole initialisé et session ouverte")
+        
+        reconcile = self.config.getboolean('GlobalSettings', 'reconcile', fallback=False)
+        if self.account_index is None or reconcile:
+            with metrics.phase('firefly_get_accounts'):
+                self.account_index = build_firefly_account_index(self.firefly_client)
+        
+        exporter = None
+        if self.dry_run and not replay_path:
+            exporter = TransactionExporter(self.state.data_dir, self.config.get('GlobalSettings', 'export_format', fallback=EXPORT_FORMAT_DEFAULT) or EXPORT_FORMAT_DEFAULT)
+        
+        context = ImportContext(self.config, self.ca_cli, self.firefly_client, self.state, self.journal, self.account_index, self.rule_engine, metrics, exporter, self.stop_event)
+        
+        if context.reconcile:
+            logger.info("Réconciliation demandée : l'index local sera reconstruit depuis Firefly")
+        
+        try:
+            account_count = self._import(context, backfill_since, replay_path)
+        finally:
+            if exporter:
+                exporter.close()
+        
+        logger.info(f"Nombre de comptes traités : {account_count}")
+        
+        self.journal.compact()
+        
+        http_stats = {name: value - http_stats_before[name] for name, value in self.firefly_client.session.stats.as_dict().items()}
+        logger.info(f"Requêtes HTTP Firefly : {http_stats['requests']} (relances : {http_stats['retries']}, échecs : {http_stats['failures']})")
+        
+        # Rapport d'exécution (JSON et Prometheus) pour diagnostiquer une exécution lente sans logs DEBUG
+        report = metrics.report(
+            mode='replay' if replay_path else 'backfill' if backfill_since else 'import',
+            dry_run=bool(exporter),
+            accounts=account_count,
+            startup_seconds=round(self.startup_seconds, 3),
+            http=http_stats,
+        )
+        if exporter:
+            report['export_file'] = exporter.path
+        logger.info(f"Durées par phase : {metrics.summary(report)}")
+        self.last_report = report
+        write_reports(report, self.state.data_dir, self.config.get('GlobalSettings', 'metrics_textfile', fallback='') or None)
+
+    def _import(self, context, backfill_since, replay_path):
+        """Traitement des comptes selon le mode d'exécution ; retourne le nombre de comptes traités"""
+        if not context.exporter:
+            # Reprise après un arrêt brutal : seules les transactions restées en suspens sont rejouées
+            replay_journal(context)
+        
+        account_count = 0
+        if replay_path:
+            logger.info(f"Rejeu de l'export {replay_path}")
+            imported_count, failed_count = replay_export(context, replay_path)
+            logger.info(f"Rejeu terminé : {imported_count} transactions importées, {failed_count} en échec")
+        elif backfill_since:
+            # Backfill : un compte à la fois, les fenêtres de dates étant déjà récupérées en parallèle
+            for account in context.metrics.timed_iter('ca_get_accounts', self.ca_cli.iter_accounts()):
+                if self.stop_event.is_set():
+                    break
+                account_count += 1
+                backfill_account(context, account, backfill_since)
+        else:
+            # Les comptes sont traités en parallèle : la récupération Crédit Agricole d'un compte
+            # se superpose aux échanges avec Firefly d'un autre
+            # Avec la détection des virements, l'envoi attend que tous les comptes soient lus
+            account_job = prepare_account if context.transfer_detector else process_account
+            futures = []
+            with ThreadPoolExecutor(max_workers=context.account_concurrency) as executor:
+                for account in context.metrics.timed_iter('ca_get_accounts', self.ca_cli.iter_accounts()):
+                    if self.stop_event.is_set():
+                        logger.info("Arrêt demandé : les comptes restants ne seront pas traités")
+                        break
+                    account_count += 1
+                    futures.append(executor.submit(account_job, context, account))
+            if context.transfer_detector:
+                import_with_transfers(context, [future.result() for future in futures if future.result()])
+        return account_count
+
+    def close(self):
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        if self.state:
+            self.state.close()
+            self.state = None
+
+def apply_settings(config, settings):
+    """Options GlobalSettings imposées par la ligne de commande (ex. --dry-run)"""
+    if settings and not config.has_section('GlobalSettings'):
+        config.add_section('GlobalSettings')
+    for option, value in (settings or {}).items():
+        config.set('GlobalSettings', option, value)
+    return config
+
+_profile_stop_event = None
+
+def init_profile_process(stop_event):
+    """Initialisation d'un processus du pool de profils : un signal reçu par le processus,
+    comme celui reçu par le processus principal, arrête l'import en cours du profil"""
+    global _profile_stop_event
+    _profile_stop_event = stop_event
+    
+    def request_stop(signum, frame):
+        stop_event.set()
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+def run_profile(name, path, config_file, backfill_since=None, settings=None):
+    """Exécution d'un profil dans un processus du pool ; retourne son résultat (rapport compris)"""
+    global _log_profile
+    _log_profile = f"<{name}> "
+    start = time.perf_counter()
+    importer = None
+    if _profile_stop_event and _profile_stop_event.is_set():
+        _log_profile = ''
+        return {'profile': name, 'status': 'error', 'error': "arrêt demandé avant le traitement du profil",
+                'duration_seconds': 0.0, 'report': None}
+    try:
+        importer = Importer(apply_settings(load_profile(load_config(config_file), name, path), settings), _profile_stop_event)
+        importer.setup()
+        importer.run(backfill_since=backfill_since)
+        report = importer.last_report
+        error = None if report else "importation interrompue (voir les logs)"
+    except Exception as e:
+        logger.exception("Une erreur s'est produite lors de l'importation du profil")
+        report, error = None, str(e)
+    finally:
+        if importer:
+            importer.close()
+        _log_profile = ''
+    return {
+        'profile': name,
+        'status': 'ok' if report else 'error',
+        'error': error,
+        'duration_seconds': round(time.perf_counter() - start, 3),
+        'report': report,
+    }
+
+class ProfileRunner:
+    """Importe plusieurs profils (un fichier .ini par personne) dans un pool de processus.
+
+    Chaque profil a son propre processus, sa session bancaire et son répertoire de données :
+    les connexions à la banque des différents profils se font en parallèle."""
+
+    def __init__(self, config, profiles_dir, settings=None):
+        self.config = config
+        self.profiles_dir = profiles_dir
+        self.settings = settings
+        self.profiles = []
+        self.profile_concurrency = max(1, config.getint('GlobalSettings', 'profile_concurrency', fallback=PROFILE_CONCURRENCY_DEFAULT))
+        self.data_dir = config.get('GlobalSettings', 'data_dir', fallback=DATA_DIR_DEFAULT)
+        self.startup_seconds = None
+        self.run_lock = threading.Lock()
+        # Partagé avec les processus des profils : un arrêt demandé au démon leur est transmis
+        self.stop_event = multiprocessing.Event()
+
+    def setup(self):
+        self.profiles = profile_paths(self.profiles_dir)
+        logger.info(f"{len(self.profiles)} profils : {', '.join(name for name, _ in self.profiles)}")
+        self.startup_seconds = time.perf_counter() - START_TIME
+
+    def run(self, backfill_since=None):
+        if not self.run_lock.acquire(blocking=False):
+            logger.warning("Une importation est déjà en cours, exécution ignorée")
+            return
+        try:
+            self._run(backfill_since)
+        except Exception as e:
+            logger.exception("Une erreur s'est produite lors de l'importation des profils")
+        finally:
+            self.run_lock.release()
+
+    def _run(self, backfill_since):
+        started_at = datetime.now().isoformat(timespec='seconds')
+        start = time.perf_counter()
+        results = []
+        # Les profils sont relus à chaque exécution : un profil ajouté est pris en compte sans redémarrage
+        self.profiles = profile_paths(self.profiles_dir)
+        with ProcessPoolExecutor(max_workers=min(self.profile_concurrency, len(self.profiles)),
+                                 initializer=init_profile_process, initargs=(self.stop_event,)) as executor:
+            futures = {}
+            for name, path in self.profiles:
+                if self.stop_event.is_set():
+                    logger.info("Arrêt demandé : les profils restants ne seront pas traités")
+                    break
+                futures[executor.submit(run_profile, name, path, CONFIG_FILE, backfill_since, self.settings)] = name
+            for future, name in futures.items():
                 try:
-                    montant = transaction.montantOp
-                    
-                    # Standardiser la date au format YYYY-MM-DD
-                    date_operation = parser.parse(transaction.dateOp) if isinstance(transaction.dateOp, str) else transaction.dateOp
-                    standardized_date = date_operation.strftime("%Y-%m-%d")
-                    
-                    # Convertir le montant en float pour éviter les différences d'arrondi
-                    standardized_amount = f"{abs(float(montant)):.2f}"
-                    
-                    # Nettoyer la description en supprimant les espaces superflus
-                    libelle = transaction.libelleOp.strip()
-
-                    transaction_key = (standardized_date, standardized_amount, libelle)
-                    
-                    # Vérification des doublons avant l'importation
-                    if transaction_key in existing_set:
-                        masked_transaction_key = tuple(mask_sensitive_info(str(item)) for item in transaction_key)
-                        logger.info(f"Doublon détecté pour la transaction : {masked_transaction_key}. Ignorée.")
-                        continue
-
-                    transaction_data = {
-                        "transactions": [{
-                            "type": "withdrawal" if montant < 0 else "deposit",
-                            "date": standardized_date,
-                            "amount": standardized_amount,
-                            "description": libelle,
-                            "source_id": firefly_account_id if montant < 0 else None,
-                            "destination_id": firefly_account_id if montant >= 0 else None,
-                        }]
-                    }
-                    
-                    firefly_client.create_transaction(transaction_data)
-                    imported_count += 1
-                
-                except requests.RequestException as e:
-                    logger.error(f"Erreur lors de l'importation de la transaction: {str(e)}")
-            
-            logger.info(f"Transactions importées pour le compte {mask_sensitive_info(account.numeroCompte)}: {imported_count}/{len(transactions)}")
+                    results.append(future.result())
+                except Exception as e:
+                    # Processus du profil interrompu (mémoire, signal)
+                    logger.error(f"Le processus du profil {name} s'est arrêté anormalement : {str(e)}")
+                    results.append({'profile': name, 'status': 'error', 'error': str(e), 'duration_seconds': 0.0, 'report': None})
+        
+        report = aggregate_reports(results, started_at, time.perf_counter() - start)
+        for result in results:
+            if result['status'] == 'ok':
+                counters = result['report']['counters']
+                logger.info(f"Profil {result['profile']} : {counters.get('transactions_imported', 0)} transactions importées en {result['duration_seconds']:.1f} s")
+            else:
+                logger.error(f"Profil {result['profile']} en échec : {result['error']}")
+        logger.info(f"Profils importés : {report['profiles_ok']}/{len(results)} en {report['duration_seconds']:.1f} s")
+        write_profiles_report(report, self.data_dir, self.config.get('GlobalSettings', 'metrics_textfile', fallback='') or None)
+
+    def close(self):
+        pass
+
+class RunFileLock:
+    """Verrou exclusif non bloquant sur un fichier du volume de données"""
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, RUN_LOCK_FILE)
+        self.lock_file = None
+
+    def __enter__(self):
+        self.lock_file = open(self.path, 'w')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        return True
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.lock_file:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+def run_daemon(importer):
+    def request_stop(signum, frame):
+        logger.info(f"Signal {signal.Signals(signum).name} reçu : arrêt après l'exécution en cours")
+        importer.stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    
+    schedule = load_schedule(importer.config, SCHEDULE_DEFAULT)
+    logger.info(f"Mode démon : importation {schedule}")
+    
+    # Première exécution immédiate, comme au démarrage du conteneur en mode cron
+    importer.run()
+    run_forever(schedule, importer.run, importer.stop_event)
+    logger.info("Mode démon arrêté")
+
+def parse_args(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Import des opérations Crédit Agricole dans Firefly III")
+    arg_parser.add_argument('--backfill', action='store_true', help="Importe l'historique depuis --since, fenêtre par fenêtre")
+    arg_parser.add_argument('--since', type=parse_iso_date, help="Date de début du backfill (YYYY-MM-DD)")
+    arg_parser.add_argument('--daemon', action='store_true', help="Reste actif et importe selon la planification (schedule)")
+    arg_parser.add_argument('--check-config', action='store_true', help="Valide config.ini sans accès réseau puis quitte")
+    arg_parser.add_argument('--profiles', help="Répertoire de profils (un fichier .ini par identité), importés en parallèle")
+    arg_parser.add_argument('--dry-run', action='store_true', help="Simulation : exporte les transactions à importer (NDJSON ou CSV) sans rien envoyer à Firefly")
+    arg_parser.add_argument('--replay', metavar='EXPORT', help="Importe dans Firefly les transactions d'un export, sans interroger la banque")
+    args = arg_parser.parse_args(argv)
+    if args.backfill and not args.since:
+        arg_parser.error("--backfill nécessite --since")
+    if args.since and not args.backfill:
+        arg_parser.error("--since n'est utilisable qu'avec --backfill")
+    if args.backfill and args.daemon:
+        arg_parser.error("--backfill et --daemon sont incompatibles")
+    if args.replay and (args.backfill or args.daemon or args.dry_run or args.profiles):
+        arg_parser.error("--replay est incompatible avec --backfill, --daemon, --dry-run et --profiles")
+    return args
+
+def parse_iso_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Date invalide : {value} (format attendu YYYY-MM-DD)")
+
+def config_errors(config):
+    errors = []
+    try:
+        CreditAgricoleClient(config).validate()
+    except (configparser.Error, ValueError) as e:
+        errors.append(f"CreditAgricole : {str(e)}")
+    if not config.get('FireflyIII', 'url', fallback=None) or not config.get('FireflyIII', 'personal_access_token', fallback=None):
+        errors.append("FireflyIII : URL ou token d'accès personnel manquant")
+    try:
+        load_schedule(config, SCHEDULE_DEFAULT)
+    except ValueError as e:
+        errors.append(f"GlobalSettings : {str(e)}")
+    try:
+        TransferDetector.from_config(config)
+    except ValueError as e:
+        errors.append(f"GlobalSettings : {str(e)}")
+    for option, default in (('stream_chunk_days', STREAM_CHUNK_DAYS_DEFAULT), ('backfill_window_days', BACKFILL_WINDOW_DAYS_DEFAULT)):
+        try:
+            days = config.getint('CreditAgricole', option, fallback=default)
+        except ValueError:
+            errors.append(f"CreditAgricole : {option} doit être un nombre entier de jours")
+            continue
+        if days < 1:
+            errors.append(f"CreditAgricole : {option} doit être d'au moins 1 jour (valeur : {days})")
+    export_format = config.get('GlobalSettings', 'export_format', fallback=EXPORT_FORMAT_DEFAULT) or EXPORT_FORMAT_DEFAULT
+    if export_format not in EXPORT_FORMATS:
+        errors.append(f"GlobalSettings : format d'export inconnu '{export_format}' (attendu : {', '.join(EXPORT_FORMATS)})")
+    return errors
+
+def check_config(config, profiles_dir=None):
+    """Validation de la configuration sans charger les bibliothèques réseau ; retourne le code de sortie"""
+    if profiles_dir:
+        # Chaque profil est validé tel qu'il sera importé (config.ini complété par le profil)
+        errors = []
+        try:
+            for name, path in profile_paths(profiles_dir):
+                try:
+                    errors.extend(f"profil {name} - {error}" for error in config_errors(load_profile(config, name, path)))
+                except (configparser.Error, ValueError) as e:
+                    errors.append(f"profil {name} - {str(e)}")
+        except ValueError as e:
+            errors.append(str(e))
+    else:
+        errors = config_errors(config)
+    for error in errors:
+        logger.error(f"Configuration invalide - {error}")
+    if not errors:
+        logger.info(f"Configuration valide ({(time.perf_counter() - START_TIME) * 1000:.0f} ms)")
+    return 1 if errors else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    importer = None
+    try:
+        config = load_config()
+        
+        profiles_dir = args.profiles or config.get('GlobalSettings', 'profiles_dir', fallback='')
+        
+        if args.check_config:
+            sys.exit(check_config(config, profiles_dir))
+        
+        settings = {'dry_run': 'true'} if args.dry_run else {}
+        
+        # Plusieurs identités : un processus par profil ; sinon l'identité unique de config.ini
+        importer = ProfileRunner(config, profiles_dir, settings) if profiles_dir and not args.replay else Importer(apply_settings(config, settings))
+        
+        importer.setup()
+        
+        logger.info(f"Temps de démarrage : {importer.startup_seconds * 1000:.0f} ms")
+        
+        if args.daemon:
+            run_daemon(importer)
+        elif args.replay:
+            importer.run(replay_path=args.replay)
+        else:
+            importer.run(backfill_since=args.since if args.backfill else None)
     
     except Exception as e:
         logger.exception("Une erreur s'est produite lors de l'importation")
     
+    finally:
+        if importer:
+            importer.close()
+    
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+RUN_REPORT_FILE = 'run_report.json'
+PROMETHEUS_FILE = 'importer.prom'
+PROMETHEUS_PREFIX = 'ca_importer'
+
+_END = object()
+
+logger = logging.getLogger(__name__)
+
+
+class RunMetrics:
+    """Durées par phase et compteurs d'une exécution, partagés entre les threads d'import.
+
+    Chaque phase mesure son temps propre : une phase imbriquée dans une autre (lecture des
+    opérations bancaires pendant le dédoublonnage, par exemple) n'est comptée qu'une fois.
+    Les phases exécutées en parallèle cumulent les durées de tous les threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+
+    def _record(self, name, seconds, rows):
+        with self.lock:
+            phase = self.phases.setdefault(name, {'seconds': 0.0, 'rows': 0})
+            phase['seconds'] += seconds
+            phase['rows'] += rows
+
+    @contextmanager
+    def phase(self, name, rows=0):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        # Temps passé dans les phases imbriquées, déduit de la phase courante
+        nested = [0.0]
+        stack.append(nested)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            self._record(name, elapsed - nested[0], rows)
+
+    def timed_iter(self, name, iterable):
+        """Mesure le temps passé à produire chaque élément d'un itérable (une ligne par élément)"""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            self.add_rows(name, 1)
+            yield item
+
+    def add_rows(self, name, rows):
+        self._record(name, 0.0, rows)
+
+    def timed_call(self, name, function, *args):
+        with self.phase(name, rows=1):
+            return function(*args)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, **extra):
+        duration = time.perf_counter() - self.start
+        with self.lock:
+            phases = {
+                name: {
+                    'seconds': round(phase['seconds'], 3),
+                    'rows': phase['rows'],
+                    'rows_per_second': round(phase['rows'] / phase['seconds'], 1) if phase['seconds'] and phase['rows'] else None,
+                }
+                for name, phase in self.phases.items()
+            }
+            counters = dict(self.counters)
+        report = {
+            'started_at': self.started_at,
+            'duration_seconds': round(duration, 3),
+            'phases': phases,
+            'counters': counters,
+        }
+        report.update(extra)
+        return report
+
+    def summary(self, report):
+        parts = []
+        for name, phase in sorted(report['phases'].items(), key=lambda item: -item[1]['seconds']):
+            rate = f", {phase['rows_per_second']:.0f}/s" if phase['rows_per_second'] else ''
+            parts.append(f"{name} {phase['seconds']:.1f} s ({phase['rows']} lignes{rate})")
+        return ' ; '.join(parts)
+
+
+def prometheus_text(reports):
+    """Format texte Prometheus (collecteur textfile de node_exporter) ; reports : [(étiquettes, rapport)]"""
+    # Le format impose de regrouper les échantillons d'une même métrique, quel que soit le rapport
+    families = {}
+
+    def metric(name, value, help_text, labels):
+        full_name = f"{PROMETHEUS_PREFIX}_{name}"
+        samples = families.setdefault(full_name, (help_text, []))[1]
+        label_text = '{' + ','.join(f'{key}="{label}"' for key, label in labels.items()) + '}' if labels else ''
+        samples.append(f"{full_name}{label_text} {value}")
+
+    for labels, report in reports:
+        metric('last_run_timestamp_seconds', int(time.time()), "Fin de la dernière exécution (epoch)", labels)
+        metric('run_duration_seconds', report['duration_seconds'], "Durée de la dernière exécution", labels)
+        if report.get('startup_seconds') is not None:
+            metric('startup_seconds', report['startup_seconds'], "Temps de démarrage du processus", labels)
+        for name, phase in sorted(report['phases'].items()):
+            metric('phase_seconds', phase['seconds'], "Durée cumulée par phase", {**labels, 'phase': name})
+            metric('phase_rows', phase['rows'], "Lignes traitées par phase", {**labels, 'phase': name})
+        for name, value in sorted(report.get('http', {}).items()):
+            metric(f"http_{name}", value, f"Requêtes HTTP Firefly ({name})", labels)
+        for name, value in sorted(report['counters'].items()):
+            metric(name, value, f"Compteur {name}", labels)
+
+    lines = []
+    for full_name, (help_text, samples) in families.items():
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} gauge")
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def write_atomic(path, content):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as report_file:
+        report_file.write(content)
+    os.replace(temporary_path, path)
+
+
+def write_reports(report, data_dir, textfile_path=None):
+    """Rapport JSON et fichier Prometheus de l'exécution, dans le volume de données"""
+    try:
+        write_atomic(os.path.join(data_dir, RUN_REPORT_FILE), json.dumps(report, indent=2, ensure_ascii=False) + '\n')
+        write_atomic(textfile_path or os.path.join(data_dir, PROMETHEUS_FILE), prometheus_text([({}, report)]))
+    except OSError as e:
+        logger.error(f"Impossible d'écrire le rapport d'exécution : {str(e)}")
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Normalisation des dates et montants utilisée pour les clés de dédoublonnage.
+
+Les formats connus (ISO-8601 de Firefly, dateOp du Crédit Agricole) sont lus par un
+chemin rapide à format fixe ; dateutil n'est utilisé qu'en dernier recours. Les montants
+sont manipulés en centimes entiers, sans passer par float pour les chaînes.
+"""
+import hashlib
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+EXTERNAL_ID_PREFIX = 'ca-'
+
+
+def normalize_date(value):
+    """Retourne la date au format YYYY-MM-DD"""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    value = value.strip()
+    # ISO-8601 (Firefly : 2024-01-15T00:00:00+01:00) : la partie date est conservée telle quelle
+    if len(value) >= 10 and value[4] == '-' and value[7] == '-' and value[:4].isdigit() \
+            and value[5:7].isdigit() and value[8:10].isdigit() and (len(value) == 10 or value[10] in 'T '):
+        return value[:10]
+    # Format Crédit Agricole : "Jan 15, 2024 12:00:00 AM"
+    parts = value.split(' ', 3)
+    if len(parts) >= 3:
+        month = MONTHS.get(parts[0][:3].lower())
+        day = parts[1].rstrip(',')
+        if month and day.isdigit() and parts[2].isdigit() and len(parts[2]) == 4:
+            return f"{parts[2]}-{month:02d}-{int(day):02d}"
+    from dateutil import parser
+    return parser.parse(value).strftime("%Y-%m-%d")
+
+
+def normalize_amount(value):
+    """Retourne le montant en centimes entiers (signé)"""
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        # Les montants bancaires ont au plus deux décimales : l'arrondi corrige l'erreur binaire
+        return int(round(value * 100))
+    if isinstance(value, Decimal):
+        return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    text = value.strip()
+    negative = text.startswith('-')
+    whole, _, fraction = text.lstrip('+-').partition('.')
+    # Chemin rapide : décimales au-delà du centime nulles (Firefly renvoie 12 décimales)
+    if whole.isdigit() and (not fraction or (fraction.isdigit() and not fraction[2:].strip('0'))):
+        cents = int(whole) * 100 + int(fraction[:2].ljust(2, '0'))
+        return -cents if negative else cents
+    try:
+        return int((Decimal(text) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"Montant invalide : {value!r}")
+
+
+def format_amount(cents):
+    """Centimes entiers vers la représentation texte attendue par Firefly (ex. 1234 -> '12.34')"""
+    sign = '-' if cents < 0 else ''
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def dedup_key(date_value, amount_value, description):
+    """Clé (date, montant absolu, libellé) commune aux transactions Firefly et aux opérations CA"""
+    return (normalize_date(date_value), format_amount(abs(normalize_amount(amount_value))), description.strip())
+
+
+def operation_fingerprint(account_number, key, occurrence=0):
+    """Identifiant stable d'une opération CA, envoyé à Firefly comme external_id.
+
+    occurrence distingue les opérations identiques d'un même jour (deux cafés au même prix) :
+    c'est le rang de l'opération parmi celles de même clé lues pour le compte."""
+    payload = '|'.join((account_number,) + tuple(key) + (str(occurrence),))
+    return EXTERNAL_ID_PREFIX + hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
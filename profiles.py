@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import configparser
+import json
+import logging
+import os
+from datetime import datetime
+
+from constant import DATA_DIR_DEFAULT
+from metrics import PROMETHEUS_FILE, prometheus_text, write_atomic
+
+PROFILE_CONCURRENCY_DEFAULT = 2
+PROFILES_DATA_DIR = 'profiles'
+PROFILES_REPORT_FILE = 'profiles_report.json'
+# Chemins propres à chaque profil : hérités de config.ini, ils seraient partagés entre les profils
+PROFILE_PRIVATE_OPTIONS = ('data_dir', 'metrics_textfile', 'profiles_dir')
+
+logger = logging.getLogger(__name__)
+
+
+def profile_paths(profiles_dir):
+    """[(nom, chemin)] des fichiers <nom>.ini du répertoire de profils, par ordre alphabétique"""
+    if not os.path.isdir(profiles_dir):
+        raise ValueError(f"Répertoire de profils introuvable : {profiles_dir}")
+    paths = [
+        (file_name[:-len('.ini')], os.path.join(profiles_dir, file_name))
+        for file_name in sorted(os.listdir(profiles_dir)) if file_name.endswith('.ini')
+    ]
+    if not paths:
+        raise ValueError(f"Aucun profil (*.ini) dans {profiles_dir}")
+    return paths
+
+
+def raw_sections(config):
+    # Valeurs brutes : un mot de passe contenant « % » ne doit pas être interprété
+    return {section: dict(config.items(section, raw=True)) for section in config.sections()}
+
+
+def load_profile(base_config, name, path):
+    """Configuration d'un profil : config.ini complété par le fichier du profil.
+
+    Chaque profil dispose de son propre répertoire de données (index, journal, session bancaire,
+    rapports), sous-répertoire du répertoire de données commun sauf s'il en définit un."""
+    overrides = configparser.ConfigParser()
+    if not overrides.read(path, encoding='utf-8'):
+        raise ValueError(f"Profil illisible : {path}")
+    config = configparser.ConfigParser()
+    config.read_dict(raw_sections(base_config))
+    if not config.has_section('GlobalSettings'):
+        config.add_section('GlobalSettings')
+    for option in PROFILE_PRIVATE_OPTIONS:
+        config.remove_option('GlobalSettings', option)
+    base_data_dir = base_config.get('GlobalSettings', 'data_dir', fallback=DATA_DIR_DEFAULT)
+    config.set('GlobalSettings', 'data_dir', os.path.join(base_data_dir, PROFILES_DATA_DIR, name))
+    config.read_dict(raw_sections(overrides))
+    return config
+
+
+def aggregate_reports(results, started_at, duration_seconds):
+    """Rapport commun à tous les profils : résultat de chacun et totaux"""
+    totals = {}
+    for result in results:
+        report = result.get('report') or {}
+        for name, value in list(report.get('counters', {}).items()) + [(f"http_{name}", value) for name, value in report.get('http', {}).items()]:
+            totals[name] = totals.get(name, 0) + value
+    return {
+        'started_at': started_at,
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'duration_seconds': round(duration_seconds, 3),
+        'profiles_ok': sum(1 for result in results if result['status'] == 'ok'),
+        'profiles_failed': sum(1 for result in results if result['status'] != 'ok'),
+        'totals': totals,
+        'profiles': {result['profile']: result for result in results},
+    }
+
+
+def write_profiles_report(report, data_dir, textfile_path=None):
+    """Rapport JSON commun et fichier Prometheus étiqueté par profil, dans le répertoire de données commun"""
+    labelled_reports = []
+    for name, result in report['profiles'].items():
+        profile_report = result.get('report') or {'duration_seconds': result['duration_seconds'], 'phases': {}, 'counters': {}}
+        # Un profil en échec reste visible dans Prometheus (run_failed = 1)
+        profile_report = dict(profile_report, counters=dict(profile_report['counters'], run_failed=int(result['status'] != 'ok')))
+        labelled_reports.append(({'profile': name}, profile_report))
+    try:
+        os.makedirs(data_dir, exist_ok=True)
+        write_atomic(os.path.join(data_dir, PROFILES_REPORT_FILE), json.dumps(report, indent=2, ensure_ascii=False) + '\n')
+        write_atomic(textfile_path or os.path.join(data_dir, PROMETHEUS_FILE), prometheus_text(labelled_reports))
+    except OSError as e:
+        logger.error(f"Impossible d'écrire le rapport des profils : {str(e)}")
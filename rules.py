@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import logging
+import re
+
+from constant import (A_RENAME_TRANSACTION_SECTION, AA_BUDGET_SECTION, AA_CATEGORY_SECTION,
+                      AA_ACCOUNT_SECTION, AA_TAGS_SECTION)
+
+# Sections à valeur unique : la première règle (ordre de la configuration) qui correspond l'emporte
+SINGLE_VALUE_SECTIONS = (A_RENAME_TRANSACTION_SECTION, AA_BUDGET_SECTION, AA_CATEGORY_SECTION, AA_ACCOUNT_SECTION)
+RULE_SECTIONS = SINGLE_VALUE_SECTIONS + (AA_TAGS_SECTION,)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_rules(rules_string):
+    """'valeur:mot1,mot2;valeur2:mot3' -> [(valeur, [mot1, mot2]), (valeur2, [mot3])]"""
+    rules = []
+    for entry in rules_string.split(';'):
+        value, separator, keywords = entry.partition(':')
+        if not separator:
+            if entry.strip():
+                logger.warning(f"Règle ignorée (format attendu valeur:mot1,mot2) : {entry.strip()}")
+            continue
+        keywords = [keyword.strip() for keyword in keywords.split(',') if keyword.strip()]
+        if value.strip() and keywords:
+            rules.append((value.strip(), keywords))
+    return rules
+
+
+class RuleEngine:
+    """Règles AutoRename / AutoAssign compilées en une seule expression régulière.
+
+    Tous les mots-clés de toutes les sections forment une alternative unique : un seul parcours
+    du libellé suffit à trouver l'ensemble des règles applicables, quel que soit leur nombre."""
+
+    def __init__(self, rulebook):
+        # mot-clé (minuscules) -> [(section, rang de la règle, valeur)]
+        keyword_rules = {}
+        for section, rules in rulebook.items():
+            for rank, (value, keywords) in enumerate(rules):
+                for keyword in keywords:
+                    keyword_rules.setdefault(keyword.lower(), []).append((section, rank, value))
+        self.rule_count = sum(len(rules) for rules in rulebook.values())
+
+        # L'alternative retient le mot-clé le plus long à chaque position ; les mots-clés plus courts
+        # qui en sont des préfixes correspondent aussi et sont rattachés à l'avance
+        self.matches = {}
+        for keyword in keyword_rules:
+            self.matches[keyword] = [
+                rule for length in range(1, len(keyword) + 1)
+                for rule in keyword_rules.get(keyword[:length], ())
+            ]
+
+        self.pattern = None
+        if keyword_rules:
+            alternatives = '|'.join(re.escape(keyword) for keyword in sorted(keyword_rules, key=len, reverse=True))
+            # Lookahead : les correspondances qui se chevauchent sont toutes trouvées
+            self.pattern = re.compile(f"(?=({alternatives}))", re.IGNORECASE)
+
+    @classmethod
+    def from_config(cls, config):
+        rulebook = {}
+        for section in RULE_SECTIONS:
+            if not config.has_section(section) or not config.getboolean(section, 'enabled', fallback=True):
+                continue
+            rules = parse_rules(config.get(section, 'rules', fallback=''))
+            if rules:
+                rulebook[section] = rules
+        engine = cls(rulebook)
+        if engine.rule_count:
+            logger.info(f"{engine.rule_count} règles de renommage/affectation chargées")
+        return engine
+
+    def label(self, text):
+        """Retourne {section: valeur} (liste de valeurs pour les tags) pour les règles correspondant au texte"""
+        if not self.pattern:
+            return {}
+        best = {}
+        tags = []
+        for match in self.pattern.finditer(text):
+            for section, rank, value in self.matches.get(match.group(1).lower(), ()):
+                if section == AA_TAGS_SECTION:
+                    if value not in tags:
+                        tags.append(value)
+                elif section not in best or rank < best[section][0]:
+                    best[section] = (rank, value)
+        labels = {section: value for section, (rank, value) in best.items()}
+        if tags:
+            labels[AA_TAGS_SECTION] = tags
+        return labels
+
+    def apply(self, split, libelle):
+        """Complète un split de transaction Firefly à partir du libellé bancaire d'origine"""
+        labels = self.label(libelle)
+        if A_RENAME_TRANSACTION_SECTION in labels:
+            split['description'] = labels[A_RENAME_TRANSACTION_SECTION]
+        if AA_BUDGET_SECTION in labels:
+            split['budget_name'] = labels[AA_BUDGET_SECTION]
+        if AA_CATEGORY_SECTION in labels:
+            split['category_name'] = labels[AA_CATEGORY_SECTION]
+        if AA_ACCOUNT_SECTION in labels:
+            # Compte de contrepartie : dépense pour un retrait, revenu pour un dépôt
+            counterpart = 'destination_name' if split['type'] == 'withdrawal' else 'source_name'
+            split[counterpart] = labels[AA_ACCOUNT_SECTION]
+        if AA_TAGS_SECTION in labels:
+            split['tags'] = labels[AA_TAGS_SECTION]
+        return split
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class CronSchedule:
+    """Expression cron à 5 champs (minute heure jour mois jour_semaine) : *, listes, plages et pas"""
+
+    FIELDS = (
+        ('minute', 0, 59),
+        ('hour', 0, 23),
+        ('day', 1, 31),
+        ('month', 1, 12),
+        ('weekday', 0, 7),
+    )
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Expression cron invalide : '{expression}' (5 champs attendus)")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse_field(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)
+        )
+        # 0 et 7 désignent tous deux le dimanche
+        self.weekdays = frozenset(weekday % 7 for weekday in weekdays)
+        # Comme cron : si jour et jour de semaine sont restreints, l'un ou l'autre suffit
+        self.day_restricted = parts[2] != '*'
+        self.weekday_restricted = parts[4] != '*'
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for item in field.split(','):
+            item, _, step = item.partition('/')
+            step = int(step) if step else 1
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(value) for value in item.split('-', 1))
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Valeur cron hors limites : '{field}'")
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, moment):
+        # cron : 0 = dimanche ; datetime.weekday() : 0 = lundi
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment):
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Plusieurs années pour couvrir les 29 février ; la recherche avance par mois/jour/heure, donc reste rapide
+        limit = candidate + timedelta(days=366 * 8)
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+        raise ValueError(f"Aucune date ne correspond à l'expression cron '{self.expression}'")
+
+    def __str__(self):
+        return f"cron '{self.expression}'"
+
+
+class IntervalSchedule:
+    def __init__(self, minutes):
+        if minutes <= 0:
+            raise ValueError("L'intervalle doit être strictement positif")
+        self.interval = timedelta(minutes=minutes)
+
+    def next_after(self, moment):
+        return moment + self.interval
+
+    def __str__(self):
+        return f"toutes les {int(self.interval.total_seconds() // 60)} minutes"
+
+
+def load_schedule(config, default_expression):
+    interval_minutes = config.getint('GlobalSettings', 'schedule_interval_minutes', fallback=0)
+    if interval_minutes:
+        return IntervalSchedule(interval_minutes)
+    return CronSchedule(config.get('GlobalSettings', 'schedule', fallback=default_expression) or default_expression)
+
+
+def run_forever(schedule, job, stop_event):
+    """Exécute job selon schedule jusqu'à ce que stop_event soit positionné"""
+    while not stop_event.is_set():
+        next_run = schedule.next_after(datetime.now())
+        logger.info(f"Prochaine exécution planifiée le {next_run.strftime('%Y-%m-%d %H:%M')} ({schedule})")
+        if stop_event.wait(timeout=max(0.0, (next_run - datetime.now()).total_seconds())):
+            break
+        job()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from itertools import islice
+
+STATE_DB_NAME = 'state.db'
+SEED_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Etat persistant de l'importeur (SQLite dans le volume de données)"""
+
+    def __init__(self, data_dir):
+        os.makedirs(data_dir, exist_ok=True)
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, STATE_DB_NAME)
+        # Connexion partagée entre les threads de traitement des comptes, protégée par un verrou
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS dedup_keys ("
+                " account_id TEXT NOT NULL,"
+                " date TEXT NOT NULL,"
+                " amount TEXT NOT NULL,"
+                " description TEXT NOT NULL,"
+                " PRIMARY KEY (account_id, date, amount, description)"
+                ") WITHOUT ROWID"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS imported_ids ("
+                " account_id TEXT NOT NULL,"
+                " external_id TEXT NOT NULL,"
+                " PRIMARY KEY (account_id, external_id)"
+                ") WITHOUT ROWID"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS seeded_accounts ("
+                " account_id TEXT PRIMARY KEY,"
+                " seeded_at TEXT NOT NULL"
+                ")"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks ("
+                " account_id TEXT PRIMARY KEY,"
+                " last_date TEXT NOT NULL,"
+                " updated_at TEXT NOT NULL"
+                ")"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS backfill_progress ("
+                " account_id TEXT NOT NULL,"
+                " since TEXT NOT NULL,"
+                " completed_until TEXT NOT NULL,"
+                " PRIMARY KEY (account_id, since)"
+                ")"
+            )
+
+    def is_seeded(self, account_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM seeded_accounts WHERE account_id = ?", (str(account_id),)
+            ).fetchone()
+        return row is not None
+
+    def seed(self, account_id, entries):
+        """Remplace l'index du compte par les entrées (external_id, clé) issues de Firefly"""
+        account_id = str(account_id)
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM dedup_keys WHERE account_id = ?", (account_id,))
+            self.conn.execute("DELETE FROM imported_ids WHERE account_id = ?", (account_id,))
+            self.conn.execute("DELETE FROM seeded_accounts WHERE account_id = ?", (account_id,))
+        # Les clés sont insérées par lots au fil de la lecture, sans matérialiser l'historique en mémoire
+        # ni bloquer les autres comptes pendant le téléchargement
+        count = 0
+        entries = iter(entries)
+        while True:
+            batch = list(islice(entries, SEED_BATCH_SIZE))
+            if not batch:
+                break
+            with self.lock, self.conn:
+                count += self.conn.executemany(
+                    "INSERT OR IGNORE INTO imported_ids VALUES (?, ?)",
+                    ((account_id, external_id) for external_id, _ in batch if external_id)
+                ).rowcount
+                count += self.conn.executemany(
+                    "INSERT OR IGNORE INTO dedup_keys VALUES (?, ?, ?, ?)",
+                    ((account_id,) + tuple(key) for external_id, key in batch if not external_id)
+                ).rowcount
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO seeded_accounts VALUES (?, ?)",
+                (account_id, datetime.now().isoformat(timespec='seconds'))
+            )
+        logger.info(f"Index de dédoublonnage reconstruit pour le compte Firefly ID {account_id} : {count} clés")
+
+    def contains(self, account_id, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM dedup_keys WHERE account_id = ? AND date = ? AND amount = ? AND description = ?",
+                (str(account_id),) + tuple(key)
+            ).fetchone()
+        return row is not None
+
+    def contains_external_id(self, account_id, external_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM imported_ids WHERE account_id = ? AND external_id = ?",
+                (str(account_id), external_id)
+            ).fetchone()
+        return row is not None
+
+    def add_external_id(self, account_id, external_id):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO imported_ids VALUES (?, ?)", (str(account_id), external_id))
+
+    def get_watermark(self, account_id):
+        """Date (YYYY-MM-DD) de la dernière opération importée avec succès pour le compte"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT last_date FROM watermarks WHERE account_id = ?", (str(account_id),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, account_id, last_date):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)",
+                (str(account_id), last_date, datetime.now().isoformat(timespec='seconds'))
+            )
+
+    def get_backfill_progress(self, account_id, since):
+        """Fin de la dernière fenêtre de backfill importée pour ce compte et cette date de début"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT completed_until FROM backfill_progress WHERE account_id = ? AND since = ?",
+                (str(account_id), since)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_backfill_progress(self, account_id, since, completed_until):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO backfill_progress VALUES (?, ?, ?)",
+                (str(account_id), since, completed_until)
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
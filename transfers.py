@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import date
+from difflib import SequenceMatcher
+
+from constant import AUTO_DETECT_TRANSFERS_DEFAULT
+from normalize import normalize_amount
+
+TRANSFER_DATE_TOLERANCE_DAYS_DEFAULT = 2
+TRANSFER_LABEL_SIMILARITY_DEFAULT = 0.0
+
+# Champs propres aux retraits/dépôts, refusés par Firefly sur un virement entre comptes d'actif
+NON_TRANSFER_FIELDS = ('source_name', 'destination_name', 'budget_name')
+
+logger = logging.getLogger(__name__)
+
+
+def split_account_id(split):
+    """Compte Firefly importé d'un split : source d'un retrait, destination d'un dépôt"""
+    return split['source_id'] if split['type'] == 'withdrawal' else split['destination_id']
+
+
+def transfer_payload(withdrawal_data, deposit_data):
+    """Un seul virement Firefly pour le couple retrait/dépôt ; l'external_id du dépôt est conservé
+    en internal_reference pour que les deux opérations restent reconnues au dédoublonnage"""
+    split = dict(withdrawal_data['transactions'][0])
+    deposit_split = deposit_data['transactions'][0]
+    for field in NON_TRANSFER_FIELDS:
+        split.pop(field, None)
+    split.update({
+        "type": "transfer",
+        "destination_id": deposit_split['destination_id'],
+        "internal_reference": deposit_split['external_id'],
+    })
+    return {"error_if_duplicate_hash": True, "transactions": [split]}
+
+
+class TransferDetector:
+    """Rapprochement des virements entre comptes importés : un retrait et un dépôt de même montant,
+    sur deux comptes différents, à quelques jours d'intervalle.
+
+    Les dépôts sont indexés par (montant en centimes, tranche de dates) : chaque retrait ne consulte
+    que sa tranche et les deux voisines, au lieu de comparer toutes les paires d'opérations."""
+
+    def __init__(self, tolerance_days=TRANSFER_DATE_TOLERANCE_DAYS_DEFAULT, min_similarity=TRANSFER_LABEL_SIMILARITY_DEFAULT):
+        self.tolerance_days = max(0, tolerance_days)
+        self.min_similarity = min_similarity
+        # Tranches de tolerance + 1 jours : un écart d'au plus tolerance jours ne dépasse pas la tranche voisine
+        self.bucket_days = self.tolerance_days + 1
+
+    @classmethod
+    def from_config(cls, config):
+        """Détecteur configuré, ou None si la détection est désactivée"""
+        if not config.getboolean('GlobalSettings', 'auto_detect_transfers', fallback=AUTO_DETECT_TRANSFERS_DEFAULT == "True"):
+            return None
+        return cls(
+            config.getint('GlobalSettings', 'transfer_date_tolerance_days', fallback=TRANSFER_DATE_TOLERANCE_DAYS_DEFAULT),
+            config.getfloat('GlobalSettings', 'transfer_label_similarity', fallback=TRANSFER_LABEL_SIMILARITY_DEFAULT),
+        )
+
+    def similarity(self, first_label, second_label):
+        return SequenceMatcher(None, first_label.lower(), second_label.lower()).ratio()
+
+    def match(self, pending):
+        """pending : [(clé, transaction)] -> [(rang du retrait, rang du dépôt)] des virements détectés"""
+        deposits = {}
+        withdrawals = []
+        operations = []
+        for rank, (transaction_key, transaction_data) in enumerate(pending):
+            split = transaction_data['transactions'][0]
+            day = date.fromisoformat(split['date']).toordinal()
+            operation = (day, normalize_amount(split['amount']), split_account_id(split), transaction_key[2])
+            operations.append(operation)
+            if split['type'] == 'deposit':
+                deposits.setdefault((operation[1], day // self.bucket_days), []).append(rank)
+            elif split['type'] == 'withdrawal':
+                withdrawals.append(rank)
+
+        pairs = []
+        matched_deposits = set()
+        # Les retraits les plus anciens sont rapprochés en premier
+        for withdrawal_rank in sorted(withdrawals, key=lambda rank: operations[rank][0]):
+            day, cents, account_id, label = operations[withdrawal_rank]
+            bucket = day // self.bucket_days
+            best = None
+            for neighbour in (bucket - 1, bucket, bucket + 1):
+                for deposit_rank in deposits.get((cents, neighbour), ()):
+                    deposit_day, _, deposit_account_id, deposit_label = operations[deposit_rank]
+                    gap = abs(deposit_day - day)
+                    if deposit_rank in matched_deposits or deposit_account_id == account_id or gap > self.tolerance_days:
+                        continue
+                    similarity = self.similarity(label, deposit_label) if self.min_similarity else 0.0
+                    if similarity < self.min_similarity:
+                        continue
+                    # Le dépôt le plus proche en date l'emporte, puis le libellé le plus ressemblant
+                    if best is None or (gap, -similarity) < best[0]:
+                        best = ((gap, -similarity), deposit_rank)
+            if best:
+                matched_deposits.add(best[1])
+                pairs.append((withdrawal_rank, best[1]))
+        return pairs
+
+    def merge(self, pending):
+        """Remplace chaque couple retrait/dépôt rapproché par un virement ; retourne (transactions, nombre de virements)"""
+        pairs = dict(self.match(pending))
+        matched_deposits = set(pairs.values())
+        merged = []
+        for rank, (transaction_key, transaction_data) in enumerate(pending):
+            if rank in matched_deposits:
+                continue
+            if rank in pairs:
+                transaction_data = transfer_payload(transaction_data, pending[pairs[rank]][1])
+            merged.append((transaction_key, transaction_data))
+        if pairs:
+            logger.info(f"{len(pairs)} virements entre comptes détectés")
+        return merged, len(pairs)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT_DEFAULT = 5.0
+READ_TIMEOUT_DEFAULT = 60.0
+MAX_RETRIES_DEFAULT = 5
+BACKOFF_FACTOR_DEFAULT = 0.5
+BACKOFF_MAX_DEFAULT = 30.0
+# Plafond du délai demandé par le serveur (Retry-After), distinct du backoff calculé
+RETRY_AFTER_MAX_DEFAULT = 300.0
+
+# Statuts relancés pour toutes les requêtes
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Statuts relancés pour les requêtes non idempotentes (POST) : la requête n'a pas été traitée
+RETRY_STATUSES_NON_IDEMPOTENT = (429, 503)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+logger = logging.getLogger(__name__)
+
+
+def is_duplicate_response(response):
+    """Refus attendu de Firefly (error_if_duplicate_hash) : la transaction existe déjà"""
+    return response.status_code == 422 and 'Duplicate of transaction' in response.text
+
+
+class TransportStats:
+    """Compteurs de requêtes partagés entre les threads d'import"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def increment(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self.lock:
+            return {'requests': self.requests, 'retries': self.retries, 'failures': self.failures}
+
+
+class RetryingSession(requests.Session):
+    """Session requests avec pool dimensionné, timeouts et relances (backoff exponentiel avec jitter)"""
+
+    def __init__(self, pool_size=10, connect_timeout=CONNECT_TIMEOUT_DEFAULT, read_timeout=READ_TIMEOUT_DEFAULT,
+                 max_retries=MAX_RETRIES_DEFAULT, backoff_factor=BACKOFF_FACTOR_DEFAULT, backoff_max=BACKOFF_MAX_DEFAULT,
+                 retry_after_max=RETRY_AFTER_MAX_DEFAULT):
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.stats = TransportStats()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else RETRY_STATUSES_NON_IDEMPOTENT
+        attempt = 0
+        while True:
+            self.stats.increment('requests')
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Sans garantie que la requête n'a pas été traitée, seules les erreurs de connexion sont relancées en POST
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                    self.stats.increment('failures')
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Erreur réseau sur {method} {url} ({str(e)}), nouvelle tentative dans {delay:.1f}s")
+            else:
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    # Un doublon signalé par Firefly est une réponse attendue (rejeu du journal), pas un échec
+                    if response.status_code >= 400 and not is_duplicate_response(response):
+                        self.stats.increment('failures')
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                logger.warning(f"Réponse {response.status_code} sur {method} {url}, nouvelle tentative dans {delay:.1f}s")
+                response.close()
+            self.stats.increment('retries')
+            attempt += 1
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # Backoff exponentiel avec "full jitter" pour étaler les relances des threads concurrents
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+
+    def _retry_after(self, response):
+        retry_after = response.headers.get('Retry-After')
+        if not retry_after:
+            return None
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        # Délai du serveur respecté : une relance anticipée recevrait un nouveau 429
+        return min(self.retry_after_max, max(0.0, delay))